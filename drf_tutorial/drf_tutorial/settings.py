@@ -53,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.instrumentation.RequestMetricsMiddleware',
+    'movies.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -96,8 +98,24 @@ if env.get('POSTGRES_HOST'):
             'NAME': env.get('POSTGRES_DB'),
             'USER': env.get('POSTGRES_USER'),
             'PASSWORD': env.get('POSTGRES_PASSWORD'),
+            # Seconds a connection is kept open between requests
+            'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 60)),
+            # Ping a reused connection at the start of each request
+            'CONN_HEALTH_CHECKS': env.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
         }
     }
+    if env.get('DB_POOL_SIZE'):
+        # In-process pool: connections go back to it after every request
+        # and are validated with a ping when checked out again
+        DATABASES['default'].update({
+            'ENGINE': 'movies.backends.postgresql_pool',
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False,
+            'POOL': {
+                'MAX_SIZE': int(env['DB_POOL_SIZE']),
+                'TIMEOUT': float(env.get('DB_POOL_TIMEOUT', 10)),
+            },
+        })
 else:
     DATABASES = {
         'default': {
@@ -106,6 +124,24 @@ else:
         }
     }
 
+# Read replicas of the default database as "host=weight,host" (PostgreSQL)
+# or "path=weight,path" (SQLite); catalog GETs are spread over them by weight
+DATABASE_REPLICAS = {}
+for number, replica in enumerate(filter(None, env.get('DATABASE_REPLICAS', '').split(',')), 1):
+    location, _, weight = replica.strip().partition('=')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if env.get('POSTGRES_HOST') else 'NAME': location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ['movies.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = int(env.get('REPLICA_STICKY_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -150,11 +186,49 @@ STATICFILES_DIRS = [STATIC_DIR]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+IMAGE_VARIANT_WORKERS = int(env.get('IMAGE_VARIANT_WORKERS', 2))
+# Seconds a resolved variant URL is cached instead of asking the storage
+IMAGE_VARIANT_URL_CACHE_TIMEOUT = int(env.get('IMAGE_VARIANT_URL_CACHE_TIMEOUT', 60 * 60))
+
+# Background jobs run by "manage.py run_jobs"
+JOB_MAX_ATTEMPTS = int(env.get('JOB_MAX_ATTEMPTS', 5))
+# Seconds before the first retry, doubled after each failed attempt
+JOB_RETRY_DELAY = int(env.get('JOB_RETRY_DELAY', 30))
+# Seconds after which a job left running by a dead worker is run again
+JOB_LOCK_TIMEOUT = int(env.get('JOB_LOCK_TIMEOUT', 600))
+JOB_POLL_INTERVAL = float(env.get('JOB_POLL_INTERVAL', 1))
+# Seconds finished jobs are kept for the admin
+JOB_KEEP_DONE = int(env.get('JOB_KEEP_DONE', 86400))
+
+# OpenAPI schema generated once per code version and served from memory;
+# "manage.py build_openapi_schema" writes it ahead of the first request
+OPENAPI_SCHEMA_PREBUILT = env.get('OPENAPI_SCHEMA_PREBUILT', '1') == '1'
+# Written at deploy or runtime, keep it out of the sources and writable
+OPENAPI_SCHEMA_DIR = Path(env.get('OPENAPI_SCHEMA_DIR', BASE_DIR / 'openapi'))
+# Release identifier, a hash of the sources is used when it is empty
+CODE_VERSION = env.get('CODE_VERSION', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Detail cache, ETag versions, throttle buckets and facets are shared by all
+# workers, so production needs a shared backend, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache
+# CACHE_LOCATION=memcached:11211 or django_redis.cache.RedisCache with a
+# redis:// location. The per-process default only suits tests and runserver.
+CACHES = {
+    'default': {
+        'BACKEND': env.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env.get('CACHE_LOCATION', ''),
+    }
+}
+
+MOVIE_DETAIL_CACHE_TIMEOUT = int(env.get('MOVIE_DETAIL_CACHE_TIMEOUT', 60 * 15))
+MOVIE_FACETS_CACHE_TIMEOUT = int(env.get('MOVIE_FACETS_CACHE_TIMEOUT', 60 * 15))
+CATALOG_SHARED_CACHE_MAX_AGE = int(env.get('CATALOG_SHARED_CACHE_MAX_AGE', 60))
+
 CKEDITOR_UPLOAD_PATH = "uploads/"
 
 CKEDITOR_CONFIGS = {
@@ -231,8 +305,17 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 1,
+    'DEFAULT_THROTTLE_RATES': {
+        'rating': env.get('RATING_THROTTLE_RATE', '30/min'),
+        'rating-bulk': env.get('RATING_BULK_THROTTLE_RATE', '5/min'),
+        'review': env.get('REVIEW_THROTTLE_RATE', '10/min'),
+    },
 }
 
 DJOSER = {
@@ -241,6 +324,13 @@ DJOSER = {
     'ACTIVATION_URL': '#/activate/{uid}/{token}',
     'SEND_ACTIVATION_EMAIL': True,
     'SERIALIZERS': {},
+    # Rendered in the request, sent by the run_jobs worker
+    'EMAIL': {
+        'activation': 'movies.emails.ActivationEmail',
+        'confirmation': 'movies.emails.ConfirmationEmail',
+        'password_reset': 'movies.emails.PasswordResetEmail',
+        'password_changed_confirmation': 'movies.emails.PasswordChangedConfirmationEmail',
+    },
 }
 
 SIMPLE_JWT = {
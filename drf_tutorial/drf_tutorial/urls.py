@@ -17,9 +17,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from movies.admin import db_pools_view
 from .yasg import urlpatterns as doc_urls
 
 urlpatterns = [
+    path('admin/db-pools/', admin.site.admin_view(db_pools_view), name='db-pools'),
     path('admin/', admin.site.urls),
     path('', include('movies.urls')),
     path('api-auth/', include('rest_framework.urls')),
@@ -1,21 +1,166 @@
-from django.urls import path
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from hashlib import sha1
+from importlib.metadata import version
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import path, re_path
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
 from drf_yasg import openapi
+from drf_yasg.renderers import SwaggerYAMLRenderer, _SpecRenderer
 from drf_yasg.views import get_schema_view
 from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+info = openapi.Info(
+    title='Django Movie',
+    default_version='v1',
+    description='Test description',
+    license=openapi.License(name='BSD License'),
+)
 
 schema_view = get_schema_view(
-    openapi.Info(
-        title='Django Movie',
-        default_version='v1',
-        description='Test description',
-        license=openapi.License(name='BSD License'),
-    ),
+    info,
     public=True,
     permission_classes=(AllowAny,),
 )
 
+# Distributions whose code shapes the schema besides the project itself
+SCHEMA_PACKAGES = ('Django', 'djangorestframework', 'django-filter', 'djoser', 'drf-yasg')
+
+# Encoded schema documents by (code version, format): (body, etag)
+documents = {}
+documents_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """``CODE_VERSION`` or a hash of the project sources and schema packages
+
+    """
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = sha1()
+    for package in SCHEMA_PACKAGES:
+        digest.update(f'{package}=={version(package)}\n'.encode())
+    for source in sorted(settings.BASE_DIR.rglob('*.py')):
+        digest.update(f'{source.relative_to(settings.BASE_DIR)}\n'.encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def schema_format(renderer):
+    return 'yaml' if issubclass(renderer, SwaggerYAMLRenderer) else 'json'
+
+
+def schema_path(fmt, code=None):
+    return settings.OPENAPI_SCHEMA_DIR / f'openapi-{code or code_version()}.{fmt}'
+
+
+def generate_schema():
+    """Schema of the whole API, independent of the request serving it
+
+    Views are introspected with an anonymous GET request. The document has
+    no host, clients use the one they loaded it from.
+    """
+    request = Request(RequestFactory().get('/swagger/'))
+    return schema_view.generator_class(info, url='').get_schema(request, public=True)
+
+
+def encode_schema(renderer, schema=None):
+    return renderer.codec_class(renderer.validators).encode(schema or generate_schema())
+
+
+def write_file(target, body):
+    """Replace ``target`` at once, readers never see a partial file"""
+    descriptor, temporary = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(body)
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def write_schema_files():
+    """Generate the JSON and YAML schema of the current code version
+
+    Files of other versions are removed. Returns the written paths.
+    """
+    settings.OPENAPI_SCHEMA_DIR.mkdir(parents=True, exist_ok=True)
+    schema = generate_schema()
+    written = []
+    for renderer in schema_view.renderer_classes:
+        target = schema_path(schema_format(renderer))
+        if target not in written:
+            write_file(target, encode_schema(renderer, schema))
+            written.append(target)
+    for stale in settings.OPENAPI_SCHEMA_DIR.glob('openapi-*'):
+        if stale not in written:
+            stale.unlink()
+    return written
+
+
+def get_schema_document(renderer):
+    """Encoded schema and its ETag, from memory, the prebuilt file or generated once
+
+    """
+    key = (code_version(), schema_format(renderer))
+    document = documents.get(key)
+    if document is not None:
+        return document
+    with documents_lock:
+        if key not in documents:
+            source = schema_path(key[1], key[0])
+            if source.exists():
+                body = source.read_bytes()
+            else:
+                body = encode_schema(renderer)
+                try:
+                    source.parent.mkdir(parents=True, exist_ok=True)
+                    write_file(source, body)
+                except OSError:
+                    pass
+            documents[key] = body, quote_etag(sha1(body).hexdigest())
+        return documents[key]
+
+
+class PrebuiltSchemaView(schema_view):
+    """Schema view serving the prebuilt document of the current code version
+
+    Written by ``manage.py build_openapi_schema`` or on the first request,
+    the UI pages never generate it. ``OPENAPI_SCHEMA_PREBUILT = False``
+    generates it on every request.
+    """
+
+    def get(self, request, version='', format=None):
+        renderer = type(request.accepted_renderer)
+        if not settings.OPENAPI_SCHEMA_PREBUILT:
+            return super().get(request, version, format)
+        if not issubclass(renderer, _SpecRenderer):
+            # Swagger UI and ReDoc pages only show the title and version,
+            # they load the document itself from the spec URL
+            return Response(openapi.Swagger(
+                info=info, _prefix='/', _version=request.version or version, paths=openapi.Paths({}),
+            ))
+        body, etag = get_schema_document(renderer)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
 urlpatterns = [
-    path('swagger(?P<format>\.json\.yaml)', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-]
\ No newline at end of file
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', PrebuiltSchemaView.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger/', PrebuiltSchemaView.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('redoc/', PrebuiltSchemaView.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+]
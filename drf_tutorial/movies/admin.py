@@ -1,9 +1,20 @@
+from functools import partial
+
 from django import forms
 from django.contrib import admin
+from django.db import connections, transaction
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 
-from .models import Category, Genre, Movie, MovieShots, Actor, Rating, RatingStar, Review
+from .cache import bump_catalog_version, bump_versions, invalidate_after_commit
+from .dbpool import pool_stats
+from .images import variant_url
+from .models import Category, Genre, Job, Movie, MovieShots, Actor, Rating, RatingStar, Review
+from .search import search_movies
+from .service import movie_people, rebuild_rating_aggregates, with_reply_counts
 
 
 class MovieAdminForm(forms.ModelForm):
@@ -35,11 +46,18 @@ class MovieShotsInline(admin.TabularInline):
     readonly_fields = ("get_image",)
 
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="100" height="110"')
+        return mark_safe(f'<img src={variant_url(obj.image, "thumb")} width="100" height="110"')
 
     get_image.short_description = "Изображение"
 
 
+def movies_published_changed(pks):
+    """Refresh the movies, the catalog and the filmographies of their people after commit"""
+    invalidate_after_commit(pks)
+    transaction.on_commit(partial(bump_versions, 'actor', movie_people(pks)))
+    transaction.on_commit(bump_catalog_version)
+
+
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
     """Фильмы"""
@@ -76,11 +94,22 @@ class MovieAdmin(admin.ModelAdmin):
     )
 
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.poster.url} width="100" height="110"')
+        return mark_safe(f'<img src={variant_url(obj.poster, "thumb")} width="100" height="110"')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу фильмов"""
+        if not search_term:
+            return queryset, False
+        found = search_movies(Movie.objects.all(), search_term, limit=None)
+        return queryset.filter(
+            Q(pk__in=found.values('pk')) | Q(category__name__icontains=search_term)
+        ), False
 
     def unpublish(self, request, queryset):
         """Снять с публикации"""
+        pks = list(queryset.values_list('pk', flat=True))
         row_update = queryset.update(draft=True)
+        movies_published_changed(pks)
         if row_update == 1:
             message_bit = "1 запись была обновлена"
         else:
@@ -89,7 +118,9 @@ class MovieAdmin(admin.ModelAdmin):
 
     def publish(self, request, queryset):
         """Опубликовать"""
+        pks = list(queryset.values_list('pk', flat=True))
         row_update = queryset.update(draft=False)
+        movies_published_changed(pks)
         if row_update == 1:
             message_bit = "1 запись была обновлена"
         else:
@@ -108,9 +139,24 @@ class MovieAdmin(admin.ModelAdmin):
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     """Отзывы к фильму"""
-    list_display = ("name", "email", "parent", "movie", "id")
+    list_display = ("name", "email", "parent", "movie", "id", "get_reply_count")
     readonly_fields = ("name", "email")
 
+    def get_readonly_fields(self, request, obj=None):
+        """Путь отзыва задан при создании, ветку и фильм не меняем"""
+        if obj is None:
+            return self.readonly_fields
+        return self.readonly_fields + ("parent", "movie")
+
+    def get_queryset(self, request):
+        return with_reply_counts(super().get_queryset(request))
+
+    def get_reply_count(self, obj):
+        return obj.reply_count
+
+    get_reply_count.short_description = "Ответы"
+    get_reply_count.admin_order_field = "reply_count"
+
 
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
@@ -125,7 +171,7 @@ class ActorAdmin(admin.ModelAdmin):
     readonly_fields = ("get_image",)
 
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="50" height="60"')
+        return mark_safe(f'<img src={variant_url(obj.image, "thumb")} width="50" height="60"')
 
     get_image.short_description = "Изображение"
 
@@ -135,6 +181,14 @@ class RatingAdmin(admin.ModelAdmin):
     """Рейтинг"""
     list_display = ("star", "movie", "ip")
 
+    def save_model(self, request, obj, form, change):
+        """Пересчитать рейтинг старого и нового фильма"""
+        movie_ids = {obj.movie_id}
+        if change:
+            movie_ids.update(Rating.objects.filter(pk=obj.pk).values_list('movie_id', flat=True))
+        super().save_model(request, obj, form, change)
+        rebuild_rating_aggregates(Movie.objects.filter(pk__in=movie_ids))
+
 
 @admin.register(MovieShots)
 class MovieShotsAdmin(admin.ModelAdmin):
@@ -143,12 +197,48 @@ class MovieShotsAdmin(admin.ModelAdmin):
     readonly_fields = ("get_image",)
 
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="50" height="60"')
+        return mark_safe(f'<img src={variant_url(obj.image, "thumb")} width="50" height="60"')
 
     get_image.short_description = "Изображение"
 
 
 admin.site.register(RatingStar)
 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Фоновые задачи"""
+    list_display = ("task", "status", "attempts", "run_at", "created")
+    list_filter = ("status", "task")
+    readonly_fields = ("task", "payload", "attempts", "locked_at", "last_error", "created")
+    actions = ["retry"]
+
+    def retry(self, request, queryset):
+        """Запустить снова"""
+        row_update = queryset.update(status=Job.PENDING, run_at=timezone.now(), attempts=0, locked_at=None)
+        self.message_user(request, f"{row_update} задач поставлено в очередь")
+
+    retry.short_description = "Запустить снова"
+
+
+def db_pools_view(request):
+    """Соединения с базой данных и пулы процесса"""
+    stats = pool_stats()
+    databases = [
+        {
+            'alias': alias,
+            'engine': options['ENGINE'],
+            'conn_max_age': options['CONN_MAX_AGE'],
+            'health_checks': options.get('CONN_HEALTH_CHECKS', False),
+            'pool': stats.get(alias),
+        }
+        for alias, options in connections.settings.items()
+    ]
+    return TemplateResponse(request, 'admin/db_pools.html', {
+        **admin.site.each_context(request),
+        'title': 'Соединения с базой данных',
+        'databases': databases,
+    })
+
 admin.site.site_title = "Django Movies"
 admin.site.site_header = "Django Movies"
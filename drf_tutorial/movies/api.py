@@ -3,23 +3,29 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 
 from .models import Actor
+from .routers import ReplicaReadMixin
 from .serializers import (
-    ActorListSerializer, ActorDetailSerializer,
+    ActorListSerializer, ActorFilmographySerializer,
 )
+from .service import PaginationActor, with_filmography, with_filmography_counts
 
 
-class ActorViewSet(ViewSet):
+class ActorViewSet(ReplicaReadMixin, ViewSet):
     """Actor view set
 
     """
 
     def list(self, request):
-        queryset = Actor.objects.all()
-        serializer = ActorListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = with_filmography_counts(Actor.objects.order_by('pk'))
+        paginator = PaginationActor()
+        page = paginator.paginate_queryset(
+            ActorListSerializer(many=True).values(queryset), request, view=self
+        )
+        serializer = ActorListSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk=None):
-        queryset = Actor.objects.all()
+        queryset = with_filmography(Actor.objects.all())
         actor = get_object_or_404(queryset, pk=pk)
-        serializer = ActorDetailSerializer(actor)
+        serializer = ActorFilmographySerializer(actor)
         return Response(serializer.data)
@@ -0,0 +1,44 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .dbpool import release_connections
+from .views import ActorsViewSet, MovieViewSet
+
+
+def call_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+        release_connections()
+
+
+def run_in_thread_pool(view):
+    """Async view running a read-only sync view in the shared thread pool
+
+    Under ASGI Django runs sync views with ``thread_sensitive=True``, so
+    all of them are serialized on a single thread. Read-only catalog
+    views do not need that, here they run concurrently with
+    ``thread_sensitive=False`` while the event loop stays free. Queries
+    and rendering both happen in the worker thread, each worker keeps
+    its own connection, closed according to ``CONN_MAX_AGE``; pooled
+    connections go back to the pool after every call.
+    """
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(call_view, thread_sensitive=False)(
+            view, request, *args, **kwargs
+        )
+    return async_view
+
+
+movie_list = run_in_thread_pool(MovieViewSet.as_view({'get': 'list'}))
+movie_detail = run_in_thread_pool(MovieViewSet.as_view({'get': 'retrieve'}))
+actor_list = run_in_thread_pool(ActorsViewSet.as_view({'get': 'list'}))
+actor_detail = run_in_thread_pool(ActorsViewSet.as_view({'get': 'retrieve'}))
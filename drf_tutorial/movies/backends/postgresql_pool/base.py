@@ -0,0 +1,64 @@
+import psycopg2.extensions
+import psycopg2.extras
+from django.db.backends.postgresql.base import Database, DatabaseWrapper as PostgresDatabaseWrapper
+
+from movies.dbpool import ConnectionPool, get_pool, pools
+
+
+def connect(conn_params):
+    connection = Database.connect(**conn_params)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def ping(connection):
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """psycopg2 backend taking connections from a per-process pool
+
+    ``POOL`` of the database settings holds ``MAX_SIZE`` and ``TIMEOUT``.
+    Django closes the connection at the end of every request
+    (``CONN_MAX_AGE = 0``), which hands it back to the pool; the next
+    checkout validates it with ``SELECT 1`` first. Threads outside the
+    request cycle return theirs with ``dbpool.release_connections``.
+    """
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(self.alias, lambda: ConnectionPool(
+            lambda: connect(conn_params), ping,
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 10.0),
+        ))
+
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool(conn_params).checkout()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = pools[self.alias]
+        connection = self.connection
+        broken = bool(connection.closed)
+        if not broken and connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Database.Error:
+                broken = True
+        pool.checkin(connection, broken=broken)
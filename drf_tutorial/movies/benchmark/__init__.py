@@ -0,0 +1,2 @@
+from .catalog import generate_catalog
+from .harness import run_benchmark
@@ -0,0 +1,146 @@
+import random
+from datetime import date
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from ..models import Actor, Category, Genre, Movie, Rating, RatingStar, Review
+from ..cards import rebuild_movie_cards
+from ..search import update_search_index
+from ..service import rebuild_rating_aggregates
+
+WORDS = (
+    'night', 'river', 'iron', 'silent', 'golden', 'last', 'broken', 'city',
+    'winter', 'shadow', 'empire', 'storm', 'lost', 'red', 'glass', 'garden',
+    'machine', 'ocean', 'dream', 'wild', 'secret', 'echo', 'fire', 'north',
+)
+COUNTRIES = ('USA', 'France', 'Japan', 'Germany', 'Italy', 'Korea', 'Spain')
+
+
+def next_id(model):
+    return (model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0) + 1
+
+
+def text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def generate_catalog(movies=100, actors=None, genres=20, categories=5,
+                     reviews=10, reply_ratio=0.6, ratings=20,
+                     cast_size=5, seed=0, batch_size=1000):
+    """Fill the database with a deterministic synthetic catalog
+
+    The same arguments and seed always produce the same rows. ``reviews``
+    and ``ratings`` are per movie; with ``reply_ratio`` a review answers a
+    random earlier review of the same movie, which builds threads of
+    varying depth. Primary keys are assigned explicitly so that reply
+    parents are known without reading back inserted rows.
+    """
+    rnd = random.Random(seed)
+    actors = movies * 2 if actors is None else actors
+    with transaction.atomic():
+        if not RatingStar.objects.exists():
+            RatingStar.objects.bulk_create(
+                RatingStar(value=value) for value in range(1, 6)
+            )
+        stars = list(RatingStar.objects.order_by('value'))
+
+        category_id = next_id(Category)
+        category_objs = [
+            Category(
+                pk=category_id + i, name=f'Category {i}', description=text(rnd, 10),
+                url=f'bench-category-{category_id + i}',
+            ) for i in range(categories)
+        ]
+        Category.objects.bulk_create(category_objs, batch_size=batch_size)
+
+        genre_id = next_id(Genre)
+        genre_objs = [
+            Genre(
+                pk=genre_id + i, name=f'Genre {genre_id + i}',
+                description=text(rnd, 10), url=f'bench-genre-{genre_id + i}',
+            ) for i in range(genres)
+        ]
+        Genre.objects.bulk_create(genre_objs, batch_size=batch_size)
+
+        actor_id = next_id(Actor)
+        actor_objs = [
+            Actor(
+                pk=actor_id + i, name=f'Actor {actor_id + i}', age=rnd.randint(18, 90),
+                description=text(rnd, 40), image=f'actors/bench-{i % 50}.jpg',
+            ) for i in range(actors)
+        ]
+        Actor.objects.bulk_create(actor_objs, batch_size=batch_size)
+
+        movie_id = next_id(Movie)
+        movie_objs = [
+            Movie(
+                pk=movie_id + i, title=text(rnd, 3).title(), tagline=text(rnd, 5),
+                description=text(rnd, 80), poster=f'movies/bench-{i % 50}.jpg',
+                year=rnd.randint(1950, 2021), country=rnd.choice(COUNTRIES),
+                world_premiere=date(rnd.randint(1950, 2021), rnd.randint(1, 12), 1),
+                budget=rnd.randint(0, 10 ** 8),
+                category=rnd.choice(category_objs) if category_objs else None,
+                url=f'bench-movie-{movie_id + i}', draft=rnd.random() < 0.05,
+            ) for i in range(movies)
+        ]
+        Movie.objects.bulk_create(movie_objs, batch_size=batch_size)
+
+        movie_actors, movie_directors, movie_genres = [], [], []
+        for movie in movie_objs:
+            for actor in rnd.sample(actor_objs, min(cast_size, len(actor_objs))):
+                movie_actors.append(Movie.actors.through(movie_id=movie.pk, actor_id=actor.pk))
+            for actor in rnd.sample(actor_objs, min(1 + cast_size // 5, len(actor_objs))):
+                movie_directors.append(Movie.directors.through(movie_id=movie.pk, actor_id=actor.pk))
+            for genre in rnd.sample(genre_objs, min(rnd.randint(1, 3), len(genre_objs))):
+                movie_genres.append(Movie.genres.through(movie_id=movie.pk, genre_id=genre.pk))
+        Movie.actors.through.objects.bulk_create(movie_actors, batch_size=batch_size)
+        Movie.directors.through.objects.bulk_create(movie_directors, batch_size=batch_size)
+        Movie.genres.through.objects.bulk_create(movie_genres, batch_size=batch_size)
+
+        review_id = next_id(Review)
+        review_objs = []
+        for movie in movie_objs:
+            thread = []
+            for i in range(reviews):
+                parent = rnd.choice(thread) if thread and rnd.random() < reply_ratio else None
+                review = Review(
+                    pk=review_id, email=f'user{review_id}@example.com', name=f'User {review_id}',
+                    text=text(rnd, 30), parent=parent, movie_id=movie.pk,
+                )
+                review.path = review.build_path()
+                review_objs.append(review)
+                thread.append(review)
+                review_id += 1
+        Review.objects.bulk_create(review_objs, batch_size=batch_size)
+
+        rating_objs = [
+            Rating(
+                ip=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+                star=rnd.choice(stars), movie_id=movie.pk,
+            )
+            for movie in movie_objs for i in range(ratings)
+        ]
+        Rating.objects.bulk_create(rating_objs, batch_size=batch_size)
+
+        movie_ids = [movie.pk for movie in movie_objs]
+        rebuild_rating_aggregates(Movie.objects.filter(pk__in=movie_ids))
+        for start in range(0, len(movie_ids), batch_size):
+            update_search_index(movie_ids[start:start + batch_size])
+            rebuild_movie_cards(movie_ids[start:start + batch_size])
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [Category, Genre, Actor, Movie, Review]
+            ):
+                cursor.execute(sql)
+
+    return {
+        'categories': len(category_objs),
+        'genres': len(genre_objs),
+        'actors': len(actor_objs),
+        'movies': len(movie_objs),
+        'reviews': len(review_objs),
+        'ratings': len(rating_objs),
+    }
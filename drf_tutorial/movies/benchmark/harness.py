@@ -0,0 +1,133 @@
+import math
+import statistics
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .. import api, views
+from ..models import Actor, Movie, RatingStar
+
+Route = namedtuple('Route', 'name method path data view kwargs user', defaults=(None, None, None, None))
+
+
+def default_routes():
+    """Every route of movies/urls.py and movies/api.py with sample arguments
+
+    """
+    movie = Movie.objects.filter(draft=False).order_by('pk').first()
+    actor = Actor.objects.order_by('pk').first()
+    star = RatingStar.objects.order_by('-value').first()
+    movies = list(Movie.objects.order_by('pk').values_list('pk', flat=True)[:100])
+    term = movie.title.split()[0]
+    return [
+        Route('movie-list', 'get', '/movie/'),
+        Route('movie-list-cursor', 'get', '/movie/?pagination=cursor'),
+        Route('movie-list-shared', 'get', '/movie/?shared=1'),
+        Route('movie-list-facets', 'get', '/movie/?facets=1'),
+        Route('movie-detail', 'get', f'/movie/{movie.pk}/'),
+        Route('movie-export-ndjson', 'get', '/movie/export/'),
+        Route('movie-export-csv', 'get', '/movie/export/?format=csv'),
+        Route('movie-search', 'get', f'/movie/search/?q={term}'),
+        Route('actor-list', 'get', '/actors/'),
+        Route('actor-detail', 'get', f'/actors/{actor.pk}'),
+        Route('async-movie-list', 'get', '/async/movie/'),
+        Route('async-movie-detail', 'get', f'/async/movie/{movie.pk}/'),
+        Route('async-actor-list', 'get', '/async/actors/'),
+        Route('async-actor-detail', 'get', f'/async/actors/{actor.pk}'),
+        Route('review-create', 'post', '/review/', {
+            'email': 'bench@example.com', 'name': 'Bench', 'text': 'Benchmark review',
+            'movie': movie.pk,
+        }),
+        Route('rating-create', 'post', '/rating/', {'star': star.pk, 'movie': movie.pk}),
+        Route('rating-bulk', 'post', '/rating/bulk/', {
+            'ratings': [{'movie': pk, 'star': star.pk} for pk in movies],
+        }),
+        Route('rating-mine', 'get', f'/rating/mine/?movies={",".join(map(str, movies))}'),
+        Route('api-actor-list', 'get', '/api/actors/',
+              view=api.ActorViewSet.as_view({'get': 'list'})),
+        Route('api-actor-detail', 'get', f'/api/actors/{actor.pk}/',
+              view=api.ActorViewSet.as_view({'get': 'retrieve'}), kwargs={'pk': actor.pk}),
+        Route('metrics', 'get', '/metrics/', view=views.RequestMetricsView.as_view(),
+              user=User(username='bench', is_staff=True)),
+    ]
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list
+
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def request(client, factory, route):
+    if route.view is None:
+        return getattr(client, route.method)(
+            route.path, route.data, content_type='application/json'
+        ) if route.data is not None else getattr(client, route.method)(route.path)
+    django_request = getattr(factory, route.method)(route.path, route.data, format='json')
+    if route.user is not None:
+        force_authenticate(django_request, user=route.user)
+    response = route.view(django_request, **(route.kwargs or {}))
+    response.render()
+    return response
+
+
+def response_body(response):
+    """Content of a response, streamed ones are consumed"""
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def run_benchmark(routes=None, repeat=50, warmup=5, cold_cache=False):
+    """Drive each route and collect latency, SQL query count and size
+
+    Returns one dict per route with p50/p95/mean latency in milliseconds,
+    the maximal number of queries of a request and the response size in
+    bytes. With ``cold_cache`` the cache is cleared before every request.
+    Write throttling is off, every request reaches the database.
+    """
+    with override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {},
+    }):
+        return drive_routes(routes, repeat, warmup, cold_cache)
+
+
+def drive_routes(routes, repeat, warmup, cold_cache):
+    client = Client()
+    factory = APIRequestFactory()
+    results = []
+    for route in routes or default_routes():
+        for _ in range(warmup):
+            response_body(request(client, factory, route))
+        timings, queries = [], []
+        for _ in range(repeat):
+            if cold_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(client, factory, route)
+                body = response_body(response)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        results.append({
+            'route': route.name,
+            'method': route.method.upper(),
+            'path': route.path,
+            'status': response.status_code,
+            'requests': repeat,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': max(queries),
+            'response_bytes': len(body),
+        })
+    return results
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from django.test import AsyncClient
+
+from .harness import percentile
+
+
+async def drive(path, requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    statuses = set()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses.add(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'path': path,
+        'concurrency': concurrency,
+        'requests': requests,
+        'statuses': sorted(statuses),
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+
+
+def run_load(pairs, requests=500, concurrency=(1, 10, 50, 100)):
+    """Compare sync and async paths through the ASGI request handler
+
+    ``pairs`` maps a name to the (sync path, async path) of one endpoint.
+    Every path is driven with ``requests`` GETs at each concurrency level.
+    """
+    results = []
+    for name, (sync_path, async_path) in pairs.items():
+        for level in concurrency:
+            for mode, path in (('sync', sync_path), ('async', async_path)):
+                result = asyncio.run(drive(path, requests, level))
+                results.append({'endpoint': name, 'mode': mode, **result})
+    return results
@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from ..models import Actor, Movie
+from ..renderers import ORJSONRenderer, orjson
+from ..serializers import ActorListSerializer, MovieListSerializer
+from ..service import with_filmography_counts
+
+
+def list_querysets():
+    """Querysets the list serializers are benchmarked on, as the views build them
+
+    """
+    return {
+        'movie-list': (
+            MovieListSerializer,
+            Movie.objects.filter(draft=False).annotate(rating_user=Count('ratings')).order_by('pk'),
+        ),
+        'actor-list': (ActorListSerializer, with_filmography_counts(Actor.objects.order_by('pk'))),
+    }
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3), result
+
+
+def run_serialization_benchmark(page_sizes=(100, 1000), repeat=20):
+    """Median time of serializing and rendering list pages
+
+    Each page is serialized field by field from model instances and with
+    the ``values()`` fast path, and the fast path output is rendered with
+    the stdlib and the orjson renderer.
+    """
+    results = []
+    for name, (serializer_class, queryset) in list_querysets().items():
+        for page_size in page_sizes:
+            page = queryset[:page_size]
+
+            def fields():
+                return ListSerializer(child=serializer_class()).to_representation(list(page.all()))
+
+            def values():
+                return serializer_class(page, many=True).data
+
+            fields_ms, _ = timed(fields, repeat)
+            values_ms, data = timed(values, repeat)
+            json_ms, _ = timed(lambda: JSONRenderer().render(data), repeat)
+            orjson_ms, _ = timed(lambda: ORJSONRenderer().render(data), repeat)
+            results.append({
+                'serializer': name,
+                'page_size': page_size,
+                'rows': len(data),
+                'fields_ms': fields_ms,
+                'values_ms': values_ms,
+                'serializer_speedup': round(fields_ms / values_ms, 2),
+                'json_render_ms': json_ms,
+                'orjson_render_ms': orjson_ms,
+                'render_speedup': round(json_ms / orjson_ms, 2),
+                'orjson': orjson is not None,
+            })
+    return results
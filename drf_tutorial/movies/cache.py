@@ -0,0 +1,100 @@
+import time
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+
+MOVIE_DETAIL_KEY = 'movies:movie-detail:{}'
+CATALOG_VERSION_KEY = 'movies:catalog-version'
+MOVIE_FACETS_KEY = 'movies:facets:{}:{}'
+VERSION_KEY = 'movies:version:{}'
+VARIANT_URL_KEY = 'movies:variant-url:{}'
+
+# Sent after commit with ``movie_ids`` whose derived data is stale
+movies_changed = Signal()
+
+
+def get_movie_detail(pk):
+    """Cached shared part of the movie detail response
+
+    """
+    return cache.get(MOVIE_DETAIL_KEY.format(pk))
+
+
+def set_movie_detail(pk, data):
+    cache.set(
+        MOVIE_DETAIL_KEY.format(pk), data, settings.MOVIE_DETAIL_CACHE_TIMEOUT
+    )
+
+
+def invalidate_movie_detail(*pks):
+    cache.delete_many([MOVIE_DETAIL_KEY.format(pk) for pk in pks])
+
+
+def invalidate_after_commit(pks):
+    """Refresh derived data of movies once the current transaction is committed
+
+    """
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(partial(movies_changed.send, sender=None, movie_ids=pks))
+
+
+def get_catalog_version():
+    """Version of the published catalog, bumped on every movie or genre change
+
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+
+
+def get_movie_facets(filters):
+    return cache.get(MOVIE_FACETS_KEY.format(get_catalog_version(), filters))
+
+
+def set_movie_facets(filters, facets):
+    cache.set(
+        MOVIE_FACETS_KEY.format(get_catalog_version(), filters), facets,
+        settings.MOVIE_FACETS_CACHE_TIMEOUT,
+    )
+
+
+def new_version():
+    return uuid4().hex, time.time()
+
+
+def get_versions(*scopes):
+    """``(token, modified timestamp)`` of each scope, started on first use
+
+    """
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_version(), None)
+            found[key] = cache.get(key) or new_version()
+        versions.append(found[key])
+    return versions
+
+
+def bump_versions(name, pks=()):
+    """Start new versions of the ``name`` collection and of its given objects
+
+    """
+    scopes = [f'{name}-list', *(f'{name}:{pk}' for pk in pks)]
+    version = new_version()
+    cache.set_many({VERSION_KEY.format(scope): version for scope in scopes}, None)
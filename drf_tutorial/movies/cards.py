@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .jobs import enqueue, task_name
+from .models import Job, Movie, MovieCard, Review
+from .serializers import MovieDetailSerializer, MovieListSerializer
+
+CARD_BATCH_SIZE = 200
+
+
+def card_movies(movie_ids=None):
+    """Published movies with everything their cards need prefetched
+
+    """
+    movies = Movie.objects.filter(draft=False).select_related('category').prefetch_related(
+        'genres', 'actors', 'directors',
+        Prefetch('reviews', queryset=Review.objects.order_by('path')),
+    )
+    if movie_ids is not None:
+        movies = movies.filter(pk__in=movie_ids)
+    return movies
+
+
+def list_data(movie):
+    """List payload of a movie, ``rating_user`` is filled per request
+
+    """
+    movie.rating_user = False
+    return MovieListSerializer(movie).data
+
+
+def detail_data(movie):
+    """Detail payload of a movie with media URLs relative to the site
+
+    """
+    return MovieDetailSerializer(movie).data
+
+
+def build_card(movie):
+    return MovieCard(movie=movie, list_data=list_data(movie), detail_data=detail_data(movie))
+
+
+def rebuild_movie_cards(movie_ids):
+    """Rebuild cards of the given movies, drop cards of unpublished ones
+
+    The movie rows are locked first, so concurrent rebuilds of the same
+    movie run one after the other, and a rating or review committed
+    meanwhile is read by the rebuild that waited for it.
+    """
+    movie_ids = list(movie_ids)
+    with transaction.atomic():
+        list(Movie.objects.select_for_update().filter(pk__in=movie_ids).order_by('pk').values_list('pk'))
+        MovieCard.objects.filter(pk__in=movie_ids).delete()
+        MovieCard.objects.bulk_create(build_card(movie) for movie in card_movies(movie_ids))
+
+
+def rebuild_all_movie_cards(batch_size=CARD_BATCH_SIZE):
+    ids = list(Movie.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), batch_size):
+        rebuild_movie_cards(ids[start:start + batch_size])
+    return len(ids)
+
+
+def rebuild_missing_movie_cards(batch_size=CARD_BATCH_SIZE):
+    """Job building the cards of published movies that have none
+
+    Writes drop the cards of the movies they change, so one job catches up
+    with any number of them.
+    """
+    rebuilt = 0
+    while True:
+        ids = list(Movie.objects.filter(draft=False, card__isnull=True).order_by('pk').values_list(
+            'pk', flat=True
+        )[:batch_size])
+        if not ids:
+            return rebuilt
+        rebuild_movie_cards(ids)
+        rebuilt += len(ids)
+
+
+def expire_movie_cards(movie_ids):
+    """Drop stale cards and queue their rebuild
+
+    Until the worker rebuilds them the catalog views serialize these
+    movies live, so the request that changed them does not pay for it.
+    A pending rebuild job is reused.
+    """
+    MovieCard.objects.filter(pk__in=movie_ids).delete()
+    if not Job.objects.filter(task=task_name(rebuild_missing_movie_cards), status=Job.PENDING).exists():
+        enqueue(rebuild_missing_movie_cards)
+
+
+def with_absolute_media(detail, request):
+    """Detail payload with poster and actor images as absolute URLs
+
+    """
+    def absolute(url):
+        return request.build_absolute_uri(url) if url else url
+
+    def actors(people):
+        return [
+            {**person, **{name: absolute(person.get(name)) for name in ('image', 'image_jpeg')}}
+            for person in people
+        ]
+
+    return {
+        **detail,
+        'poster': absolute(detail.get('poster')),
+        'poster_jpeg': absolute(detail.get('poster_jpeg')),
+        'actors': actors(detail.get('actors', [])),
+        'directors': actors(detail.get('directors', [])),
+    }
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def has_shared_cache():
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_CACHES
+
+
+@register(deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """Cache invalidation and ETag versions only reach other workers through a shared cache
+
+    """
+    if settings.DEBUG or has_shared_cache():
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to memcached or Redis: '
+             'detail cache invalidation, ETag versions, throttling and the '
+             'versions bumped by run_jobs are otherwise not seen by other workers.',
+        id='movies.W001',
+    )]
@@ -0,0 +1,88 @@
+import math
+import time
+from functools import wraps
+from hashlib import sha1
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_versions
+from .routers import primary_reads
+from .service import get_client_ip
+
+
+def conditional_get(method):
+    """Answer a list or retrieve action with 304 when the client copy is current
+
+    Validators are computed from the tracked versions before the action
+    runs, so a matching ``If-None-Match`` skips the queries and the
+    serializer. ``If-Modified-Since`` alone is not trusted: with one
+    second resolution it would miss a write made in the second of the
+    client's copy.
+
+    For ``REPLICA_STICKY_SECONDS`` after a version bump the body is read
+    from the primary: a lagging replica would otherwise put the old data
+    under the new ETag, and clients would revalidate it with 304s.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        shared = self.is_shared_response() and request.accepted_renderer.format == 'json'
+        etag, last_modified = self.get_validators(request, shared)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if time.time() - last_modified < settings.REPLICA_STICKY_SECONDS:
+                with primary_reads():
+                    response = method(self, request, *args, **kwargs)
+            else:
+                response = method(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if shared:
+                patch_cache_control(
+                    response, public=True, max_age=settings.CATALOG_SHARED_CACHE_MAX_AGE
+                )
+        return response
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """Strong ETag and Last-Modified from the versions of ``version_name``
+
+    The list depends on the ``<name>-list`` version, the detail on
+    ``<name>:<pk>``. Both are bumped with ``cache.bump_versions`` on writes.
+    """
+    version_name = None
+
+    def get_version_scopes(self):
+        if self.action == 'retrieve':
+            return [f'{self.version_name}:{self.kwargs[self.lookup_url_kwarg or self.lookup_field]}']
+        return [f'{self.version_name}-list']
+
+    def is_shared_response(self):
+        """Whether the JSON response is the same for every client
+
+        Shared responses get validators without the client and public
+        ``Cache-Control``.
+        """
+        return False
+
+    def get_validators(self, request, shared=False):
+        """ETag of the response for this client and representation, and its Last-Modified
+
+        Last-Modified is rounded up to whole seconds so it is never earlier
+        than the change it reports.
+        """
+        versions = get_versions(*self.get_version_scopes())
+        digest = sha1()
+        parts = [
+            *(token for token, modified in versions),
+            request.build_absolute_uri(),
+            request.accepted_media_type,
+        ]
+        if not shared:
+            parts += [get_client_ip(request), request.user.pk]
+        for part in parts:
+            digest.update(f'{part}\n'.encode())
+        return quote_etag(digest.hexdigest()), math.ceil(max(modified for token, modified in versions))
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+from .instrumentation import current_metrics
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolStats:
+    """Counters of one connection pool
+
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.connects = 0
+        self.reconnects = 0
+        self.timeouts = 0
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'mean_wait_ms': round(self.wait_ms / (self.checkouts or 1), 3),
+            'max_wait_ms': round(self.max_wait_ms, 3),
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'timeouts': self.timeouts,
+        }
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections with pre-ping validation
+
+    ``connect`` opens a new connection and ``ping`` tells whether an idle
+    one still works; a failed ping replaces it with a new connection and
+    counts a reconnect. Checkouts block up to ``timeout`` seconds when
+    ``max_size`` connections are in use, the wait is added to the current
+    request metrics.
+    """
+
+    def __init__(self, connect, ping, max_size=10, timeout=10.0):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        self.stats = PoolStats()
+
+    def checkout(self):
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    self.stats.timeouts += 1
+                    raise PoolTimeout(f'No free connection within {self.timeout}s')
+            connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                self.size += 1
+        wait_ms = (time.perf_counter() - started) * 1000
+        reconnect = connection is not None and not self.ping(connection)
+        if reconnect:
+            self.discard(connection, release=False)
+            connection = None
+        connected = connection is None
+        if connected:
+            try:
+                connection = self.connect()
+            except Exception:
+                self.release_slot()
+                raise
+        with self.condition:
+            self.stats.checkouts += 1
+            self.stats.wait_ms += wait_ms
+            self.stats.max_wait_ms = max(self.stats.max_wait_ms, wait_ms)
+            self.stats.connects += connected
+            self.stats.reconnects += reconnect
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_pool_wait(wait_ms)
+        return connection
+
+    def checkin(self, connection, broken=False):
+        if broken:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection, release=True):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        if release:
+            self.release_slot()
+
+    def release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'max_size': self.max_size,
+                **self.stats.as_dict(),
+            }
+
+
+# Pools of this process by database alias
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    """The pool of a database alias, created with ``factory()`` on first use"""
+    with pools_lock:
+        if alias not in pools:
+            pools[alias] = factory()
+        return pools[alias]
+
+
+def pool_stats():
+    with pools_lock:
+        return {alias: pool.snapshot() for alias, pool in sorted(pools.items())}
+
+
+def release_connections():
+    """Hand the pooled connections of the current thread back to their pools
+
+    Django does that at the end of a request. Threads outside the request
+    cycle, like the async view executor or the job worker, call this when
+    they go idle, otherwise their connections stay checked out.
+    """
+    for connection in connections.all():
+        if (
+            connection.alias in pools
+            and connection.connection is not None
+            and not connection.in_atomic_block
+        ):
+            connection.close()
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    """Close persistent connections that stopped working before the request uses them
+
+    Enabled per database with ``CONN_HEALTH_CHECKS``; pooled connections
+    are checked on checkout instead.
+    """
+    for connection in connections.all():
+        if (
+            connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and connection.connection is not None
+            and not connection.is_usable()
+        ):
+            connection.close()
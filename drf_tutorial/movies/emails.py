@@ -0,0 +1,58 @@
+from django.core.mail import EmailMultiAlternatives
+from djoser import email
+
+from .jobs import enqueue
+
+
+def send_email(subject, body, from_email, to, html=None, cc=(), bcc=(), reply_to=()):
+    """Job sending a rendered email through ``EMAIL_BACKEND``
+
+    """
+    message = EmailMultiAlternatives(
+        subject, body, from_email, to, cc=cc, bcc=bcc, reply_to=reply_to
+    )
+    if html:
+        if body:
+            message.attach_alternative(html, 'text/html')
+        else:
+            message.body = html
+            message.content_subtype = 'html'
+    message.send()
+
+
+class QueuedEmailMixin:
+    """Djoser email rendered in the request and sent by the job worker
+
+    Links and tokens are built from the request as before, only the SMTP
+    round trip moves to the ``run_jobs`` worker.
+    """
+
+    def send(self, to, *args, **kwargs):
+        self.render()
+        enqueue(
+            send_email,
+            subject=self.subject,
+            body=self.body,
+            html=self.html,
+            from_email=kwargs.get('from_email', self.from_email),
+            to=list(to),
+            cc=list(kwargs.get('cc', [])),
+            bcc=list(kwargs.get('bcc', [])),
+            reply_to=list(kwargs.get('reply_to', [])),
+        )
+
+
+class ActivationEmail(QueuedEmailMixin, email.ActivationEmail):
+    pass
+
+
+class ConfirmationEmail(QueuedEmailMixin, email.ConfirmationEmail):
+    pass
+
+
+class PasswordResetEmail(QueuedEmailMixin, email.PasswordResetEmail):
+    pass
+
+
+class PasswordChangedConfirmationEmail(QueuedEmailMixin, email.PasswordChangedConfirmationEmail):
+    pass
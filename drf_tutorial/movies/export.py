@@ -0,0 +1,89 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Movie
+
+EXPORT_FIELDS = (
+    'id', 'title', 'tagline', 'year', 'country', 'world_premiere', 'url',
+    'category', 'genres', 'actors', 'directors',
+    'rating_count', 'rating_sum', 'middle_star',
+)
+EXPORT_CHUNK_SIZE = 500
+
+
+def related_names(through, movie_ids, field, using=None):
+    names = defaultdict(list)
+    rows = through.objects.using(using).filter(movie_id__in=movie_ids).order_by(
+        f'{field}__name'
+    ).values_list('movie_id', f'{field}__name')
+    for movie_id, name in rows:
+        names[movie_id].append(name)
+    return names
+
+
+def iter_movies(chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """Published movies with their relations, read chunk by chunk
+
+    Movies come from a server-side cursor via ``iterator()``, genres,
+    actors and directors are fetched with one query per relation for
+    every chunk, so memory does not grow with the catalog. ``using``
+    pins every query to one database.
+    """
+    movies = Movie.objects.using(using).filter(draft=False).order_by('pk').values_list(
+        'id', 'title', 'tagline', 'year', 'country', 'world_premiere', 'url',
+        'category__name', 'rating_count', 'rating_sum', 'middle_star',
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(movies, chunk_size))
+        if not chunk:
+            return
+        ids = [row[0] for row in chunk]
+        genres = related_names(Movie.genres.through, ids, 'genre', using)
+        actors = related_names(Movie.actors.through, ids, 'actor', using)
+        directors = related_names(Movie.directors.through, ids, 'actor', using)
+        for (pk, title, tagline, year, country, world_premiere, url, category,
+             rating_count, rating_sum, middle_star) in chunk:
+            yield {
+                'id': pk,
+                'title': title,
+                'tagline': tagline,
+                'year': year,
+                'country': country,
+                'world_premiere': world_premiere,
+                'url': url,
+                'category': category,
+                'genres': genres[pk],
+                'actors': actors[pk],
+                'directors': directors[pk],
+                'rating_count': rating_count,
+                'rating_sum': rating_sum,
+                'middle_star': middle_star,
+            }
+
+
+def ndjson_lines(movies):
+    for movie in movies:
+        yield json.dumps(movie, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """Pseudo buffer returning what is written, for csv.writer
+
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(movies):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for movie in movies:
+        yield writer.writerow([
+            '|'.join(value) if isinstance(value, list) else value
+            for value in (movie[field] for field in EXPORT_FIELDS)
+        ])
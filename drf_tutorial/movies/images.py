@@ -0,0 +1,183 @@
+import logging
+import os
+from hashlib import md5
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import PurePosixPath
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .cache import VARIANT_URL_KEY, bump_versions, movies_changed
+from .jobs import enqueue
+
+logger = logging.getLogger(__name__)
+
+# Variant name: maximal width and height in pixels
+VARIANTS = {
+    'thumb': (100, 110),
+    'small': (300, 400),
+    'medium': (800, 1000),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def variant_name(name, variant, image_format='webp'):
+    """Storage name of a variant: ``movies/poster.png`` -> ``movies/variants/poster-thumb.webp``
+
+    """
+    path = PurePosixPath(name)
+    return str(path.parent / 'variants' / f'{path.stem}-{variant}.{image_format}')
+
+
+def variant_url(field_file, variant, image_format='webp'):
+    """URL of an image variant, the original while it is not generated yet
+
+    """
+    if not field_file:
+        return None
+    return stored_variant_url(field_file.name, variant, image_format)
+
+
+def variant_url_key(name, variant, image_format):
+    return VARIANT_URL_KEY.format(md5(f'{name}:{variant}.{image_format}'.encode()).hexdigest())
+
+
+def stored_variant_url(name, variant, image_format='webp'):
+    """``variant_url`` for the name of an image in the default storage
+
+    The URL is cached, the storage is asked whether the variant exists
+    once per ``IMAGE_VARIANT_URL_CACHE_TIMEOUT`` or after ``forget_variants``.
+    """
+    if not name:
+        return None
+    key = variant_url_key(name, variant, image_format)
+    url = cache.get(key)
+    if url is None:
+        variant = variant_name(name, variant, image_format)
+        url = default_storage.url(variant if default_storage.exists(variant) else name)
+        cache.set(key, url, settings.IMAGE_VARIANT_URL_CACHE_TIMEOUT)
+    return url
+
+
+def forget_variants(name, variants=tuple(VARIANTS)):
+    """Drop the cached variant URLs of an image, once its variants are written"""
+    cache.delete_many([
+        variant_url_key(name, variant, image_format)
+        for variant in variants for image_format in FORMATS
+    ])
+
+
+def render_variants(source, targets):
+    """Write resized copies of an image, runs in a worker process
+
+    ``targets`` is a list of ``(path, width, height, format name)``.
+    """
+    from PIL import Image
+
+    with Image.open(source) as original:
+        original.load()
+        for path, width, height, image_format in targets:
+            image = original.copy()
+            image.thumbnail((width, height), Image.LANCZOS)
+            if image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            pil_format, options = FORMATS[image_format]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image.save(path, pil_format, **options)
+    return source
+
+
+def variant_targets(name, variants=tuple(VARIANTS)):
+    try:
+        source = default_storage.path(name)
+    except NotImplementedError:
+        return None, []
+    return source, [
+        (default_storage.path(variant_name(name, variant, image_format)), *VARIANTS[variant], image_format)
+        for variant in variants for image_format in FORMATS
+    ]
+
+
+def missing_variants(name):
+    """Variant sizes of a stored image with a format not written yet"""
+    return [
+        variant for variant in VARIANTS
+        if not all(
+            default_storage.exists(variant_name(name, variant, image_format)) for image_format in FORMATS
+        )
+    ]
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Spawned workers import this module, which needs configured apps
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS, mp_context=get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error('Image variants failed', exc_info=future.exception())
+
+
+def generate_variants(name, wait=False, on_done=None):
+    """Render all variants of a stored image in the process pool
+
+    ``on_done`` is called without arguments once they are written.
+    """
+    source, targets = variant_targets(name)
+    if not targets or not os.path.exists(source):
+        return None
+    future = get_executor().submit(render_variants, source, targets)
+    future.add_done_callback(log_failure)
+    if on_done is not None:
+        future.add_done_callback(lambda done: on_done() if done.exception() is None else None)
+    if wait:
+        future.result()
+    return future
+
+
+def build_variants(name, version=None, movie_ids=(), variants=tuple(VARIANTS)):
+    """Job rendering variants of a stored image in the worker
+
+    ``variants`` are the sizes to render, in every format.
+    ``version`` is a ``(name, pks)`` pair passed to ``cache.bump_versions``
+    once the variants are written, so cached responses pick up their URLs.
+    ``movie_ids`` are the movies whose cards and details show the image.
+    Web workers see the bump through the shared cache ``run_jobs`` requires.
+    """
+    source, targets = variant_targets(name, variants)
+    if targets and os.path.exists(source):
+        render_variants(source, targets)
+    forget_variants(name, variants)
+    if movie_ids:
+        movies_changed.send(sender=None, movie_ids=list(movie_ids))
+    if version is not None:
+        bump_versions(*version)
+
+
+def enqueue_variants(field_file, version=None, movie_ids=()):
+    """Queue the missing variants of a just saved image file
+
+    One job per size, so a large upload does not hold a worker for all
+    of its resizes at once.
+    """
+    if not field_file:
+        return
+    for variant in missing_variants(field_file.name):
+        enqueue(
+            build_variants, name=field_file.name, version=version, movie_ids=list(movie_ids),
+            variants=[variant],
+        )
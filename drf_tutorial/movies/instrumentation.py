@@ -0,0 +1,262 @@
+import asyncio
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SLOWEST_QUERIES = 10
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def fingerprint(sql):
+    """SQL with literals and placeholder lists collapsed
+
+    """
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'%s', '?', sql)
+    return re.sub(r'\(\?(?:, \?)+\)', '(...)', sql)
+
+
+class RequestMetrics:
+    """Timings of one request
+
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.query_times = defaultdict(float)
+        self.pool_checkouts = 0
+        self.pool_wait_ms = 0.0
+        self.view_ms = None
+        self.view_db_ms = 0.0
+        self.view_finished = None
+        self.render_ms = None
+        self.total_ms = None
+
+    def record_query(self, sql, duration_ms):
+        self.queries += 1
+        self.db_ms += duration_ms
+        key = fingerprint(sql)
+        self.query_times[key] = max(self.query_times[key], duration_ms)
+
+    def record_pool_wait(self, wait_ms):
+        self.pool_checkouts += 1
+        self.pool_wait_ms += wait_ms
+
+    def view_started(self):
+        self.view_db_ms = self.db_ms
+        return time.perf_counter()
+
+    def view_done(self, started):
+        self.view_finished = time.perf_counter()
+        self.view_ms = (self.view_finished - started) * 1000
+        self.view_db_ms = self.db_ms - self.view_db_ms
+
+    def rendered(self, response):
+        if self.view_finished is not None:
+            self.render_ms = (time.perf_counter() - self.view_finished) * 1000
+        return response
+
+    @property
+    def serializer_ms(self):
+        if self.view_ms is None:
+            return None
+        return max(self.view_ms - self.view_db_ms, 0.0)
+
+    def server_timing(self):
+        timings = [f'db;dur={self.db_ms:.2f};desc="{self.queries} queries"']
+        if self.pool_checkouts:
+            timings.append(f'pool;dur={self.pool_wait_ms:.2f};desc="{self.pool_checkouts} checkouts"')
+        if self.serializer_ms is not None:
+            timings.append(f'serializer;dur={self.serializer_ms:.2f}')
+        if self.render_ms is not None:
+            timings.append(f'render;dur={self.render_ms:.2f}')
+        timings.append(f'total;dur={self.total_ms:.2f}')
+        return ', '.join(timings)
+
+
+class RouteStats:
+    """Aggregated metrics of one route
+
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.db_ms = 0.0
+        self.pool_wait_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.queries = 0
+        self.slow_queries = {}
+
+    def add(self, metrics):
+        self.requests += 1
+        self.histogram[sum(metrics.total_ms > bound for bound in LATENCY_BUCKETS_MS)] += 1
+        self.total_ms += metrics.total_ms
+        self.db_ms += metrics.db_ms
+        self.pool_wait_ms += metrics.pool_wait_ms
+        self.serializer_ms += metrics.serializer_ms or 0.0
+        self.render_ms += metrics.render_ms or 0.0
+        self.queries += metrics.queries
+        for sql, duration in metrics.query_times.items():
+            self.slow_queries[sql] = max(self.slow_queries.get(sql, 0.0), duration)
+        if len(self.slow_queries) > SLOWEST_QUERIES * 10:
+            self.slow_queries = dict(self.slowest())
+
+    def slowest(self):
+        return sorted(
+            self.slow_queries.items(), key=lambda item: item[1], reverse=True
+        )[:SLOWEST_QUERIES]
+
+    def as_dict(self):
+        requests = self.requests or 1
+        bounds = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        return {
+            'requests': self.requests,
+            'mean_total_ms': round(self.total_ms / requests, 3),
+            'mean_db_ms': round(self.db_ms / requests, 3),
+            'mean_pool_wait_ms': round(self.pool_wait_ms / requests, 3),
+            'mean_serializer_ms': round(self.serializer_ms / requests, 3),
+            'mean_render_ms': round(self.render_ms / requests, 3),
+            'mean_queries': round(self.queries / requests, 2),
+            'histogram': dict(zip(bounds, self.histogram)),
+            'slowest_queries': [
+                {'fingerprint': sql, 'max_ms': round(duration, 3)}
+                for sql, duration in self.slowest()
+            ],
+        }
+
+
+class MetricsRegistry:
+    """Per-process metrics of all routes
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(RouteStats)
+
+    def add(self, route, metrics):
+        with self.lock:
+            self.routes[route].add(metrics)
+
+    def snapshot(self):
+        with self.lock:
+            return {route: stats.as_dict() for route, stats in sorted(self.routes.items())}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding query timings to the current request metrics
+
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, (time.perf_counter() - started) * 1000)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Install record_query on every new connection
+
+    Request metrics live in a context variable, so queries made from
+    worker threads of async views are counted as well.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def route_name(request):
+    """Method and URL pattern of a request
+
+    Requests that match no pattern share one key, so random 404 paths do
+    not grow the registry.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return f'{request.method} {UNMATCHED_ROUTE}'
+    return f'{request.method} /{match.route}'
+
+
+class RequestMetricsMiddleware:
+    """Query count, DB, serializer and render time of every request
+
+    Emitted as a ``Server-Timing`` header and aggregated per route in
+    ``registry``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        metrics.total_ms = (time.perf_counter() - metrics.started) * 1000
+        response['Server-Timing'] = metrics.server_timing()
+        registry.add(route_name(request), metrics)
+        return response
+
+
+class InstrumentedViewMixin:
+    """Splits view time from rendering for RequestMetricsMiddleware
+
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().dispatch(request, *args, **kwargs)
+        started = metrics.view_started()
+        response = super().dispatch(request, *args, **kwargs)
+        metrics.view_done(started)
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(metrics.rendered)
+        return response
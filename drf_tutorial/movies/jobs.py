@@ -0,0 +1,98 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job, job_max_attempts
+
+logger = logging.getLogger(__name__)
+
+
+def task_name(function):
+    return f'{function.__module__}.{function.__qualname__}'
+
+
+def enqueue(function, delay=0, max_attempts=None, **payload):
+    """Queue ``function(**payload)`` for the ``run_jobs`` worker
+
+    The job row is written in the current transaction, so it becomes
+    visible to the worker exactly when the data it refers to is committed.
+    The payload must be JSON serializable.
+    """
+    return Job.objects.create(
+        task=task_name(function),
+        payload=payload,
+        max_attempts=max_attempts or job_max_attempts(),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def ready_jobs(now):
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=stale)
+
+
+def claim_jobs(limit):
+    """Mark up to ``limit`` due jobs as running and return them
+
+    Jobs left running by a crashed worker for ``JOB_LOCK_TIMEOUT`` seconds
+    are due again. The conditional update claims every job for one worker
+    only, row locks with SKIP LOCKED keep concurrent workers from waiting
+    on each other where the database supports them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = Job.objects.filter(ready_jobs(now)).order_by('run_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        claimed = [
+            pk for pk in queryset.values_list('pk', flat=True)[:limit]
+            if Job.objects.filter(ready_jobs(now), pk=pk).update(status=Job.RUNNING, locked_at=now)
+        ]
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at'))
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt, doubled after every failure"""
+    return settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def run_job(job):
+    """Run a claimed job, reschedule or fail it when the task raises
+
+    """
+    job.attempts += 1
+    job.locked_at = None
+    try:
+        import_string(job.task)(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            logger.error('Job %s failed after %s attempts', job, job.attempts, exc_info=True)
+        else:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning('Job %s failed, retrying', job, exc_info=True)
+    else:
+        job.status = Job.DONE
+    job.save(update_fields=['status', 'attempts', 'locked_at', 'run_at', 'last_error'])
+    return job.status == Job.DONE
+
+
+def run_pending(limit=10):
+    """Claim and run one batch of due jobs, returns how many were claimed"""
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def purge_done_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_KEEP_DONE)
+    return Job.objects.filter(status=Job.DONE, run_at__lt=cutoff).delete()[0]
@@ -0,0 +1,77 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from movies.benchmark import generate_catalog, run_benchmark
+from .generate_catalog import add_catalog_arguments, catalog_options
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every movies endpoint on a synthetic catalog and write '
+        'p50/p95 latency, query count and response size as JSON'
+    )
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Clear the cache before every request')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Benchmark the configured database instead of a fresh test database')
+        parser.add_argument('--output', default='benchmark.json')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        if not options['use_current_db']:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            catalog = generate_catalog(**catalog_options(options))
+            results = run_benchmark(
+                repeat=options['repeat'], warmup=options['warmup'],
+                cold_cache=options['cold_cache'],
+            )
+        finally:
+            if not options['use_current_db']:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'revision': git_revision(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'catalog': catalog,
+            'options': {
+                **catalog_options(options),
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+                'cold_cache': options['cold_cache'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['route']:<20} {result['status']} "
+                f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                f"queries={result['queries']} bytes={result['response_bytes']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
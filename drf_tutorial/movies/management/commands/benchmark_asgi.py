@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from movies.benchmark import generate_catalog
+from movies.benchmark.load import run_load
+from movies.models import Actor, Movie
+from .benchmark import git_revision
+from .generate_catalog import add_catalog_arguments, catalog_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput of the sync and async catalog read views '
+        'through the ASGI handler at increasing concurrency'
+    )
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 100])
+        parser.add_argument('--output', default='benchmark-asgi.json')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            generate_catalog(**catalog_options(options))
+            movie = Movie.objects.filter(draft=False).order_by('pk').first()
+            actor = Actor.objects.order_by('pk').first()
+            results = run_load({
+                'movie-list': ('/movie/', '/async/movie/'),
+                'movie-detail': (f'/movie/{movie.pk}/', f'/async/movie/{movie.pk}/'),
+                'actor-list': ('/actors/', '/async/actors/'),
+                'actor-detail': (f'/actors/{actor.pk}', f'/async/actors/{actor.pk}'),
+            }, requests=options['requests'], concurrency=options['concurrency'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as output:
+            json.dump({
+                'revision': git_revision(),
+                'database': connection.vendor,
+                'options': {
+                    **catalog_options(options),
+                    'requests': options['requests'],
+                    'concurrency': options['concurrency'],
+                },
+                'results': results,
+            }, output, indent=2)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['endpoint']:<14} {result['mode']:<6} c={result['concurrency']:<4} "
+                f"{result['throughput_rps']:>8.1f} req/s p95={result['p95_ms']:.2f}ms "
+                f"status={result['statuses']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
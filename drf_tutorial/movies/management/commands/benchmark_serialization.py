@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from movies.benchmark import generate_catalog
+from movies.benchmark.serialization import run_serialization_benchmark
+from .benchmark import git_revision
+from .generate_catalog import add_catalog_arguments, catalog_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare field-by-field and values() serialization of the movie and '
+        'actor list serializers, and the stdlib and orjson renderers'
+    )
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser)
+        parser.set_defaults(movies=1000, reviews=0, ratings=2)
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='benchmark-serialization.json')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            generate_catalog(**catalog_options(options))
+            results = run_serialization_benchmark(
+                page_sizes=options['page_sizes'], repeat=options['repeat'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as output:
+            json.dump({
+                'revision': git_revision(),
+                'database': connection.vendor,
+                'options': {
+                    **catalog_options(options),
+                    'page_sizes': options['page_sizes'],
+                    'repeat': options['repeat'],
+                },
+                'results': results,
+            }, output, indent=2)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['serializer']:<11} n={result['page_size']:<5} "
+                f"fields={result['fields_ms']:.2f}ms values={result['values_ms']:.2f}ms "
+                f"x{result['serializer_speedup']} | json={result['json_render_ms']:.2f}ms "
+                f"orjson={result['orjson_render_ms']:.2f}ms x{result['render_speedup']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
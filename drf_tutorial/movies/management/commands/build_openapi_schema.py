@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from drf_tutorial.yasg import code_version, write_schema_files
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema of the current code version for the schema views'
+
+    def handle(self, *args, **options):
+        written = write_schema_files()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote schema {code_version()}: {", ".join(target.name for target in written)}'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from movies.benchmark import generate_catalog
+
+
+def add_catalog_arguments(parser):
+    parser.add_argument('--movies', type=int, default=100)
+    parser.add_argument('--actors', type=int, default=None, help='Defaults to twice the movies')
+    parser.add_argument('--genres', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--reviews', type=int, default=10, help='Reviews per movie')
+    parser.add_argument('--reply-ratio', type=float, default=0.6)
+    parser.add_argument('--ratings', type=int, default=20, help='Ratings per movie')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def catalog_options(options):
+    return {
+        'movies': options['movies'],
+        'actors': options['actors'],
+        'genres': options['genres'],
+        'categories': options['categories'],
+        'reviews': options['reviews'],
+        'reply_ratio': options['reply_ratio'],
+        'ratings': options['ratings'],
+        'seed': options['seed'],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a deterministic synthetic movie catalog'
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser)
+
+    def handle(self, *args, **options):
+        created = generate_catalog(**catalog_options(options))
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}' for name, count in created.items())
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from movies.cache import movies_changed
+from movies.images import forget_variants, generate_variants, missing_variants
+from movies.models import Actor, Movie, MovieShots
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP and JPEG variants of posters, actor photos and movie shots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in ((Movie, 'poster'), (Actor, 'image'), (MovieShots, 'image')):
+            names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True))
+        futures = {
+            name: generate_variants(name) for name in sorted(names)
+            if options['force'] or missing_variants(name)
+        }
+        done = []
+        for name, future in futures.items():
+            if future is not None:
+                future.result()
+                forget_variants(name)
+                done.append(name)
+        # Cards and cached details still hold the URLs of the originals
+        movie_ids = list(Movie.objects.filter(
+            Q(poster__in=done) | Q(actors__image__in=done) | Q(directors__image__in=done)
+        ).values_list('pk', flat=True).distinct())
+        if movie_ids:
+            movies_changed.send(sender=None, movie_ids=movie_ids)
+        self.stdout.write(self.style.SUCCESS(f'Generated variants of {len(done)} images'))
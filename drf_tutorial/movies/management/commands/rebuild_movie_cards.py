@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.cards import rebuild_all_movie_cards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed list and detail cards of every published movie'
+
+    def handle(self, *args, **options):
+        movies = rebuild_all_movie_cards()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt cards of {movies} movies'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.service import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored rating count, sum and middle star of every movie'
+
+    def handle(self, *args, **options):
+        updated = rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} movies'))
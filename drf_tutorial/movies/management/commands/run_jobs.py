@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from movies.checks import has_shared_cache
+from movies.dbpool import release_connections
+from movies.jobs import purge_done_jobs, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs: emails and image variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no job is due instead of polling')
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Jobs claimed at a time')
+
+    def handle(self, *args, **options):
+        if not has_shared_cache():
+            # Jobs bump response versions (actor images) that web workers
+            # only see through a cache shared with this process
+            if not settings.DEBUG:
+                raise CommandError('run_jobs needs a shared cache: set CACHE_BACKEND and CACHE_LOCATION')
+            self.stderr.write('Cache is local to this process, version bumps of jobs are not seen by web workers')
+        processed = 0
+        while True:
+            close_old_connections()
+            claimed = run_pending(options['batch'])
+            processed += claimed
+            if claimed:
+                continue
+            purge_done_jobs()
+            # A pooled connection is not held while the worker sleeps
+            release_connections()
+            if options['once']:
+                break
+            time.sleep(settings.JOB_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs'))
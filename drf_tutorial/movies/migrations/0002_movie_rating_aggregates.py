@@ -0,0 +1,60 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:18
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+import django.db.models.deletion
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Rating = apps.get_model('movies', 'Rating')
+    ratings = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    count = Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), 0)
+    total = Coalesce(Subquery(ratings.annotate(s=Sum('star__value')).values('s')), 0)
+    Movie.objects.update(
+        rating_count=count,
+        rating_sum=total,
+        middle_star=Cast(total, FloatField()) / NullIf(count, 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='middle_star',
+            field=models.FloatField(blank=True, null=True, verbose_name='Middle star'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Rating count'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Rating stars sum'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='movies.movie', verbose_name='movie'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='movies.movie', verbose_name='movie'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='movies.review', verbose_name='Parent'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
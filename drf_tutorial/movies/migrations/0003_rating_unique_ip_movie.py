@@ -0,0 +1,45 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:20
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """Keep only the latest vote of each ip for a movie"""
+    Movie = apps.get_model('movies', 'Movie')
+    Rating = apps.get_model('movies', 'Rating')
+    duplicates = Rating.objects.values('ip', 'movie').annotate(
+        latest=Max('pk'), votes=Count('pk')
+    ).filter(votes__gt=1)
+    movie_ids = set()
+    for duplicate in duplicates:
+        Rating.objects.filter(
+            ip=duplicate['ip'], movie=duplicate['movie']
+        ).exclude(pk=duplicate['latest']).delete()
+        movie_ids.add(duplicate['movie'])
+    if not movie_ids:
+        return
+    ratings = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    count = Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), 0)
+    total = Coalesce(Subquery(ratings.annotate(s=Sum('star__value')).values('s')), 0)
+    Movie.objects.filter(pk__in=movie_ids).update(
+        rating_count=count,
+        rating_sum=total,
+        middle_star=Cast(total, FloatField()) / NullIf(count, 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_movie_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('ip', 'movie'), name='unique_rating_ip_movie'),
+        ),
+    ]
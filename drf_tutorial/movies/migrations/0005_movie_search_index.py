@@ -0,0 +1,64 @@
+from django.db import migrations
+from django.utils.html import strip_tags
+
+SEARCH_CONFIG = 'english'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE movies_movie ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX movie_search_vector_idx ON movies_movie USING GIN (search_vector)'
+        )
+        schema_editor.execute(
+            '''
+            UPDATE movies_movie SET search_vector =
+                setweight(to_tsvector(%(config)s, coalesce(title, '')), 'A') ||
+                setweight(to_tsvector(%(config)s, coalesce(tagline, '')), 'B') ||
+                setweight(to_tsvector(%(config)s, regexp_replace(
+                    coalesce(description, ''), '<[^>]*>', ' ', 'g'
+                )), 'C') ||
+                setweight(to_tsvector(%(config)s, coalesce((
+                    SELECT string_agg(actor.name, ' ')
+                    FROM movies_actor actor
+                    JOIN movies_movie_actors movie_actor ON movie_actor.actor_id = actor.id
+                    WHERE movie_actor.movie_id = movies_movie.id
+                ), '')), 'B')
+            ''',
+            {'config': SEARCH_CONFIG},
+        )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE movies_movie_fts USING fts5('
+            'title, tagline, description, actors, tokenize="unicode61")'
+        )
+        Movie = apps.get_model('movies', 'Movie')
+        for movie in Movie.objects.all():
+            schema_editor.execute(
+                'INSERT INTO movies_movie_fts (rowid, title, tagline, description, actors) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                (
+                    movie.pk, movie.title, movie.tagline, strip_tags(movie.description),
+                    ' '.join(actor.name for actor in movie.actors.all()),
+                ),
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE movies_movie DROP COLUMN search_vector')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE movies_movie_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:29
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieCard',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='movies.movie', verbose_name='Movie')),
+                ('list_data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='List data')),
+                ('detail_data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Detail data')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+            ],
+            options={
+                'verbose_name': 'Movie card',
+                'verbose_name_plural': 'Movie cards',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def fill_review_paths(apps, schema_editor):
+    Review = apps.get_model('movies', 'Review')
+    parents = dict(Review.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path(pk):
+        if pk not in paths:
+            parent = parents.get(pk)
+            prefix = path(parent) if parent in parents else ''
+            paths[pk] = prefix + str(pk).zfill(PATH_STEP)
+        return paths[pk]
+
+    for pk in sorted(parents):
+        # Ancestors have lower ids in practice, so the recursion stays shallow
+        path(pk)
+    Review.objects.bulk_update(
+        [Review(pk=pk, path=value) for pk, value in paths.items()], ['path'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_movie_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=500, verbose_name='Path'),
+        ),
+        migrations.RunPython(fill_review_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', 'path'], name='review_movie_path_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:57
+
+from django.db import migrations, models
+import movies.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='max_attempts',
+            field=models.PositiveSmallIntegerField(default=movies.models.job_max_attempts, verbose_name='Max attempts'),
+        ),
+    ]
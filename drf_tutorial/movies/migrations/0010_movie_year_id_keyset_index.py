@@ -0,0 +1,21 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_job_max_attempts_setting'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='movie',
+            name='movie_published_year_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(condition=models.Q(('draft', False)), fields=['year', 'id'], name='movie_published_year_id_idx'),
+        ),
+    ]
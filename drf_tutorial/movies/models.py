@@ -1,4 +1,7 @@
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from datetime import date
 
 
@@ -50,6 +53,9 @@ class Genre(models.Model):
     class Meta:
         verbose_name = 'Genre'
         verbose_name_plural = 'Genres'
+        indexes = [
+            models.Index(fields=['name'], name='genre_name_idx'),
+        ]
 
 
 class Movie(models.Model):
@@ -84,6 +90,9 @@ class Movie(models.Model):
     )
     url = models.SlugField(max_length=160, unique=True)
     draft = models.BooleanField('Draft', default=False)
+    rating_count = models.PositiveIntegerField('Rating count', default=0)
+    rating_sum = models.PositiveIntegerField('Rating stars sum', default=0)
+    middle_star = models.FloatField('Middle star', null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -91,6 +100,32 @@ class Movie(models.Model):
     class Meta:
         verbose_name = 'Movie'
         verbose_name_plural = 'Movie'
+        indexes = [
+            models.Index(
+                fields=['year', 'id'], name='movie_published_year_id_idx',
+                condition=models.Q(draft=False),
+            ),
+        ]
+
+
+class MovieCard(models.Model):
+    """Movie card, precomputed list and detail payload of a published movie
+
+    """
+    movie = models.OneToOneField(
+        Movie, verbose_name='Movie', on_delete=models.CASCADE,
+        primary_key=True, related_name='card'
+    )
+    list_data = models.JSONField('List data', encoder=DjangoJSONEncoder)
+    detail_data = models.JSONField('Detail data', encoder=DjangoJSONEncoder)
+    updated = models.DateTimeField('Updated', auto_now=True)
+
+    def __str__(self):
+        return f'{self.movie_id}'
+
+    class Meta:
+        verbose_name = 'Movie card'
+        verbose_name_plural = 'Movie cards'
 
 
 class MovieShots(models.Model):
@@ -143,11 +178,25 @@ class Rating(models.Model):
     class Meta:
         verbose_name = 'Rating'
         verbose_name_plural = 'Ratings'
+        constraints = [
+            models.UniqueConstraint(fields=['ip', 'movie'], name='unique_rating_ip_movie'),
+        ]
+
+
+# Digits of one review id in Review.path
+REVIEW_PATH_STEP = 10
+
+
+def review_path_segment(pk):
+    return str(pk).zfill(REVIEW_PATH_STEP)
 
 
 class Review(models.Model):
     """Reviews
 
+    ``path`` is the materialized path of a review: the zero-padded ids of
+    its ancestors and of itself. Ordering by it lists a thread depth first
+    and a subtree is one range of it.
     """
     email = models.EmailField()
     name = models.CharField('Name', max_length=100)
@@ -160,10 +209,95 @@ class Review(models.Model):
         Movie, verbose_name='movie', on_delete=models.CASCADE,
         related_name='reviews',
     )
+    path = models.CharField('Path', max_length=500, default='', editable=False)
 
     def __str__(self):
         return f'{self.name} - {self.movie}'
 
+    def clean(self):
+        if self.parent is None:
+            return
+        if self.movie_id is not None and self.parent.movie_id != self.movie_id:
+            raise ValidationError({'parent': 'Reply must belong to the same movie.'})
+        if not self.parent.accepts_replies:
+            raise ValidationError({'parent': 'Reply thread is too deep.'})
+
+    def save(self, *args, **kwargs):
+        """The path is written right after the insert, when the id is known
+
+        The path is fixed at creation, moving a review to another parent
+        or movie is not supported.
+        """
+        if not self.path and self.parent is not None and not self.parent.accepts_replies:
+            raise ValidationError({'parent': 'Reply thread is too deep.'})
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not self.path:
+                self.path = self.build_path()
+                Review.objects.filter(pk=self.pk).update(path=self.path)
+
+    def build_path(self):
+        parent_path = self.parent.path if self.parent_id else ''
+        return parent_path + review_path_segment(self.pk)
+
+    @property
+    def depth(self):
+        return len(self.path) // REVIEW_PATH_STEP - 1
+
+    @property
+    def accepts_replies(self):
+        """Whether the path of a reply still fits the path column"""
+        return len(self.path) + REVIEW_PATH_STEP <= Review._meta.get_field('path').max_length
+
+    def subtree(self):
+        """This review and all its replies ordered depth first, one range query"""
+        return Review.objects.filter(
+            movie_id=self.movie_id, path__gte=self.path, path__lt=self.path + '~'
+        ).order_by('path')
+
     class Meta:
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
+        indexes = [
+            models.Index(fields=['movie', 'path'], name='review_movie_path_idx'),
+        ]
+
+
+def job_max_attempts():
+    return settings.JOB_MAX_ATTEMPTS
+
+
+class Job(models.Model):
+    """Background job, run by the ``run_jobs`` worker
+
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    task = models.CharField('Task', max_length=100)
+    payload = models.JSONField('Payload', encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField('Status', max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField('Attempts', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Max attempts', default=job_max_attempts)
+    run_at = models.DateTimeField('Run at')
+    locked_at = models.DateTimeField('Locked at', null=True, blank=True)
+    last_error = models.TextField('Last error', blank=True)
+    created = models.DateTimeField('Created', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
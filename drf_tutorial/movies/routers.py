@@ -0,0 +1,137 @@
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_COOKIE = 'db_primary'
+
+current_routing = ContextVar('current_routing', default=None)
+
+
+class RoutingState:
+    """Database routing of one request
+
+    ``pinned`` keeps reads on the primary, ``wrote`` records a write
+    during the request. The object is shared with worker threads, so a
+    write made there is seen by the middleware.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica_reads = False
+
+
+def get_replicas():
+    """Replica aliases and their weights from ``DATABASE_REPLICAS``"""
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+class ReplicaRouter:
+    """Sends reads of catalog views to weighted replicas
+
+    Reads go to a replica only inside a view that allows it (see
+    ``ReplicaReadMixin``) and only until the request or the client's
+    recent requests wrote something. Everything else uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        replicas = get_replicas()
+        if state is None or not state.replica_reads or state.pinned or state.wrote or not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choices(list(replicas), weights=list(replicas.values()))[0]
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Request scope of ``ReplicaRouter``
+
+    A request that writes sets a short lived cookie; while it is present
+    the client reads from the primary too and sees its own writes despite
+    replication lag.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = RoutingState(pinned=PRIMARY_COOKIE in request.COOKIES)
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PRIMARY_COOKIE in request.COOKIES)
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ReplicaReadMixin:
+    """Lets safe requests of a view read from replicas
+
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        state = current_routing.get()
+        if state is None or request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        state.replica_reads = True
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            state.replica_reads = False
+
+
+@contextmanager
+def primary_reads():
+    """Reads inside the block use the primary even in a replica view
+
+    For data that outlives the request, like shared cache entries, which
+    must not be filled from a lagging replica.
+    """
+    state = current_routing.get()
+    if state is None or not state.replica_reads:
+        yield
+        return
+    state.replica_reads = False
+    try:
+        yield
+    finally:
+        state.replica_reads = True
@@ -0,0 +1,136 @@
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+from .models import Movie
+
+SEARCH_CONFIG = 'english'
+SEARCH_LIMIT = 100
+FTS_TABLE = 'movies_movie_fts'
+# bm25 weights of the FTS5 columns: title, tagline, description, actors
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 5.0)
+
+POSTGRES_VECTOR = '''
+    setweight(to_tsvector(%(config)s, coalesce(title, '')), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce(tagline, '')), 'B') ||
+    setweight(to_tsvector(%(config)s, regexp_replace(
+        coalesce(description, ''), '<[^>]*>', ' ', 'g'
+    )), 'C') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(actor.name, ' ')
+        FROM movies_actor actor
+        JOIN movies_movie_actors movie_actor ON movie_actor.actor_id = actor.id
+        WHERE movie_actor.movie_id = movies_movie.id
+    ), '')), 'B')
+'''
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def fts_query(terms):
+    """FTS5 MATCH expression, every term is required and prefix matched
+
+    """
+    return ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+
+
+def actor_names(movie_ids):
+    names = defaultdict(list)
+    for movie_id, name in Movie.actors.through.objects.filter(
+        movie_id__in=movie_ids
+    ).values_list('movie_id', 'actor__name'):
+        names[movie_id].append(name)
+    return names
+
+
+def update_search_index(movie_ids):
+    """Rebuild search documents of the given movies
+
+    PostgreSQL keeps a weighted ``search_vector`` column on the movie
+    table, SQLite an FTS5 shadow table keyed by movie id.
+    """
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'UPDATE movies_movie SET search_vector = {POSTGRES_VECTOR} '
+                'WHERE id = ANY(%(ids)s)',
+                {'config': SEARCH_CONFIG, 'ids': movie_ids},
+            )
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(movie_ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', movie_ids)
+            actors = actor_names(movie_ids)
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, tagline, description, actors) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [
+                    (pk, title, tagline, strip_tags(description), ' '.join(actors[pk]))
+                    for pk, title, tagline, description in Movie.objects.filter(
+                        pk__in=movie_ids
+                    ).values_list('pk', 'title', 'tagline', 'description')
+                ],
+            )
+
+
+def delete_from_search_index(movie_ids):
+    movie_ids = list(movie_ids)
+    if connection.vendor == 'sqlite' and movie_ids:
+        placeholders = ', '.join(['%s'] * len(movie_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', movie_ids)
+
+
+def search_movies(queryset, query, limit=SEARCH_LIMIT):
+    """Movies of the queryset matching the query, best ranked first
+
+    Without a ``limit`` the result can still be filtered and reordered,
+    as the admin does. Other database backends fall back to unranked
+    ``icontains`` lookups.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = queryset.filter(RawSQL(
+            f'movies_movie.search_vector @@ {tsquery}', (query,), output_field=BooleanField()
+        )).annotate(rank=RawSQL(
+            f'ts_rank(movies_movie.search_vector, {tsquery})', (query,), output_field=FloatField()
+        )).order_by('-rank', 'pk')
+    elif connection.vendor == 'sqlite':
+        match = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        if limit is None:
+            return queryset.filter(pk__in=RawSQL(match, (fts_query(terms),)))
+        scope, scope_params = queryset.order_by().values('pk').query.sql_with_params()
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{match} AND rowid IN ({scope}) '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                (fts_query(terms), *scope_params, limit),
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=ids).annotate(rank=Case(
+            *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        )).order_by('rank')
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(title__icontains=term) | Q(tagline__icontains=term)
+                | Q(description__icontains=term) | Q(actors__name__icontains=term)
+            )
+        queryset = queryset.filter(pk__in=Movie.objects.filter(condition).values('pk'))
+    return queryset if limit is None else queryset[:limit]
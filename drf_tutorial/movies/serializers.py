@@ -1,16 +1,30 @@
+from collections import defaultdict
+from itertools import chain
+
+from django.db import IntegrityError, models, transaction
 from rest_framework import serializers
 
+from .images import stored_variant_url
 from .models import Movie, Review, Rating, Actor
+from .service import apply_rating_delta, bulk_rate_movies
+from .sparse import SparseFieldsMixin
 
 
 class FilterReviewListSerializer(serializers.ListSerializer):
-    """Filter for reviews, only parents
+    """Review forest of a movie, only parents on the top level
 
+    All reviews are fetched with one query and the children of each
+    review are attached in memory as ``tree_children``.
     """
 
     def to_representation(self, data):
-        data = data.filter(parent=None)
-        return super().to_representation(data)
+        reviews = data.all() if isinstance(data, models.Manager) else data
+        children = defaultdict(list)
+        for review in reviews:
+            children[review.parent_id].append(review)
+        for review in chain.from_iterable(children.values()):
+            review.tree_children = children.get(review.pk, [])
+        return super().to_representation(children[None])
 
 
 class RecursiveSerializer(serializers.Serializer):
@@ -23,53 +37,172 @@ class RecursiveSerializer(serializers.Serializer):
         return serializer.data
 
 
-class ActorListSerializer(serializers.ModelSerializer):
+class ValuesListSerializer(serializers.ListSerializer):
+    """Read-only list fast path over ``values()`` rows
+
+    Querysets and lists of row dicts are rendered without model instances
+    or per-row field objects: each output field reads the column named in
+    the child's ``value_columns`` (the field source by default) and goes
+    through the child's ``value_<field>`` method when it has one. Anything
+    else is serialized field by field.
+    """
+
+    def value_columns(self):
+        columns = getattr(self.child, 'value_columns', {})
+        return {name: columns.get(name, field.source) for name, field in self.child.fields.items()}
+
+    def values(self, queryset):
+        """Queryset rows with the columns this serializer reads
+
+        """
+        return queryset.values(*set(self.value_columns().values()))
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        if isinstance(data, models.QuerySet):
+            data = self.values(data)
+        elif not all(isinstance(row, dict) for row in data):
+            return super().to_representation(data)
+        converters = [
+            (name, column, getattr(self.child, f'value_{name}', None))
+            for name, column in self.value_columns().items()
+        ]
+        return [
+            {
+                name: row[column] if convert is None else convert(row[column])
+                for name, column, convert in converters
+            }
+            for row in data
+        ]
+
+
+class VariantImageField(serializers.ImageField):
+    """URL of a resized image variant, the original until it is generated
+
+    WebP variants are the default, ``*_jpeg`` fields next to them give the
+    JPEG ones to clients without WebP support.
+    """
+
+    def __init__(self, variant, image_format='webp', **kwargs):
+        self.variant = variant
+        self.image_format = image_format
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.stored_url(value.name if value else None)
+
+    def stored_url(self, name):
+        """Variant URL of the image stored under ``name``"""
+        url = stored_variant_url(name, self.variant, self.image_format)
+        request = self.context.get('request', None)
+        return request.build_absolute_uri(url) if request is not None and url else url
+
+
+class ActorListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """List of actors
 
     """
+    image = VariantImageField('small')
+    image_jpeg = VariantImageField('small', 'jpeg', source='image')
+    actor_movie_count = serializers.IntegerField(read_only=True)
+    director_movie_count = serializers.IntegerField(read_only=True)
 
     class Meta:
+        list_serializer_class = ValuesListSerializer
         model = Actor
-        fields = ['id', 'name', 'image']
+        fields = ['id', 'name', 'image', 'image_jpeg', 'actor_movie_count', 'director_movie_count']
+
+    def value_image(self, name):
+        return self.fields['image'].stored_url(name)
 
+    def value_image_jpeg(self, name):
+        return self.fields['image_jpeg'].stored_url(name)
 
-class ActorDetailSerializer(serializers.ModelSerializer):
+
+class ActorDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """List of actors
 
     """
+    image = VariantImageField('medium')
+    image_jpeg = VariantImageField('medium', 'jpeg', source='image')
 
     class Meta:
         model = Actor
         fields = '__all__'
 
 
-class MovieListSerializer(serializers.ModelSerializer):
+class MoviePersonSerializer(ActorDetailSerializer):
+    """Actor or director embedded in a movie detail
+
+    """
+    image = VariantImageField('small')
+    image_jpeg = VariantImageField('small', 'jpeg', source='image')
+
+
+class FilmographyMovieSerializer(serializers.ModelSerializer):
+    """Published movie in an actor filmography
+
+    """
+
+    class Meta:
+        model = Movie
+        fields = ('id', 'title', 'year', 'url')
+
+
+class ActorFilmographySerializer(ActorDetailSerializer):
+    """Actor detail with the published filmography
+
+    """
+    actor_movie_count = serializers.IntegerField(read_only=True)
+    director_movie_count = serializers.IntegerField(read_only=True)
+    movies = FilmographyMovieSerializer(source='published_actor_movies', many=True, read_only=True)
+    directed = FilmographyMovieSerializer(source='published_director_movies', many=True, read_only=True)
+
+
+class MovieListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Films list
 
     """
     rating_user = serializers.BooleanField()
     middle_star = serializers.FloatField()
+    value_columns = {'category': 'category_id'}
 
     class Meta:
+        list_serializer_class = ValuesListSerializer
         model = Movie
         fields = ('id', 'title', 'tagline', 'category', 'rating_user', 'middle_star')
 
+    def value_rating_user(self, value):
+        return bool(value)
+
 
 class ReviewCreateSerializer(serializers.ModelSerializer):
     """Review create serializer
 
+    The materialized path is written by ``Review.save`` after the insert.
     """
 
     class Meta:
         model = Review
         fields = '__all__'
 
+    def validate(self, attrs):
+        parent = attrs.get('parent')
+        if parent is not None:
+            if parent.movie_id != attrs['movie'].pk:
+                raise serializers.ValidationError({'parent': 'Reply must belong to the same movie.'})
+            if not parent.accepts_replies:
+                raise serializers.ValidationError({'parent': 'Reply thread is too deep.'})
+        return attrs
+
 
 class ReviewSerializer(serializers.ModelSerializer):
     """Review serializer
 
     """
-    children = RecursiveSerializer(many=True)
+    children = RecursiveSerializer(many=True, source='tree_children')
 
     class Meta:
         list_serializer_class = FilterReviewListSerializer
@@ -77,13 +210,16 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ('name', 'text', 'children')
 
 
-class MovieDetailSerializer(serializers.ModelSerializer):
+class MovieDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Films detail
 
     """
+    expandable_fields = ('directors', 'actors', 'reviews')
     category = serializers.SlugRelatedField(slug_field='name', read_only=True)
-    directors = ActorDetailSerializer(read_only=True, many=True)
-    actors = ActorDetailSerializer(read_only=True, many=True)
+    poster = VariantImageField('medium')
+    poster_jpeg = VariantImageField('medium', 'jpeg', source='poster')
+    directors = MoviePersonSerializer(read_only=True, many=True)
+    actors = MoviePersonSerializer(read_only=True, many=True)
     genres = serializers.SlugRelatedField(slug_field='name', read_only=True, many=True)
     reviews = ReviewSerializer(many=True)
 
@@ -100,10 +236,73 @@ class CreateRatingSerializer(serializers.ModelSerializer):
         model = Rating
         fields = ('star', 'movie')
 
+    def locked_rating(self, ip, movie):
+        return Rating.objects.select_for_update().select_related(
+            'star'
+        ).filter(ip=ip, movie=movie).first()
+
     def create(self, validated_data):
-        rating, upd_or_create = Rating.objects.update_or_create(
-            ip=validated_data.get('ip', None),
-            movie=validated_data.get('movie', None),
-            defaults={'star': validated_data.get('star')}
-        )
+        ip = validated_data.get('ip', None)
+        movie = validated_data.get('movie', None)
+        star = validated_data.get('star')
+        with transaction.atomic():
+            rating = self.locked_rating(ip, movie)
+            if rating is None:
+                try:
+                    with transaction.atomic():
+                        rating = Rating.objects.create(ip=ip, movie=movie, star=star)
+                except IntegrityError:
+                    # A concurrent first vote of the same ip won the unique
+                    # (ip, movie) constraint, this vote changes it instead
+                    rating = self.locked_rating(ip, movie)
+                else:
+                    apply_rating_delta(movie.pk, 1, star.value)
+                    return rating
+            if rating.star_id != star.pk:
+                old_value = rating.star.value
+                rating.star = star
+                rating.save(update_fields=['star'])
+                apply_rating_delta(movie.pk, 0, star.value - old_value)
         return rating
+
+
+class RatingItemSerializer(serializers.Serializer):
+    """One vote of a bulk rating request
+
+    """
+    movie = serializers.IntegerField()
+    star = serializers.IntegerField()
+
+
+class MovieIdsSerializer(serializers.Serializer):
+    """Movie ids of a batch lookup
+
+    """
+    movies = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000
+    )
+
+
+class BulkRatingSerializer(serializers.Serializer):
+    """Creating many movie ratings of one user at once
+
+    """
+    ratings = serializers.ListField(
+        child=RatingItemSerializer(), allow_empty=False, max_length=1000
+    )
+
+    def validate_ratings(self, ratings):
+        """One vote per movie, a repeated movie would keep only its last vote"""
+        seen, repeated = set(), []
+        for item in ratings:
+            if item['movie'] in seen and item['movie'] not in repeated:
+                repeated.append(item['movie'])
+            seen.add(item['movie'])
+        if repeated:
+            raise serializers.ValidationError(
+                f'Movies rated more than once: {", ".join(map(str, repeated))}.'
+            )
+        return ratings
+
+    def create(self, validated_data):
+        return bulk_rate_movies(validated_data['ip'], validated_data['ratings'])
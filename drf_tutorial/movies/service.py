@@ -1,11 +1,20 @@
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf
+from django.utils.http import urlencode
 from django_filters.rest_framework import (
     BaseInFilter, CharFilter, FilterSet,
     RangeFilter
 )
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor, CursorPagination, LimitOffsetPagination, PageNumberPagination
+)
 from rest_framework.response import Response
 
-from .models import Movie
+from .cache import invalidate_after_commit
+from .models import Movie, Rating, RatingStar, Review
 
 
 class PaginationMovie(PageNumberPagination):
@@ -23,6 +32,120 @@ class PaginationMovie(PageNumberPagination):
         })
 
 
+class CursorPaginationMovie(CursorPagination):
+    """Keyset pagination for the movie list
+
+    Pages are addressed by an opaque cursor holding the values of every
+    ordering column of the last (or, going back, first) row, and the next
+    page is the rows after that key in the ordering. Orderings end with
+    ``id`` so the key is unique: movies of the same year are paged by
+    ``(year, id)`` without offsets and deep pages cost the same as the
+    first one. The exact ``count`` runs a ``COUNT(*)`` and is returned
+    only when requested with ``?count=1``.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+    ordering_param = 'ordering'
+    ordering_fields = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'year': ('year', 'id'),
+        '-year': ('-year', '-id'),
+    }
+    count_query_param = 'count'
+    key_separator = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.order_by().count()
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        if self.cursor is not None:
+            queryset = queryset.filter(self.after_key(
+                self.decode_key(queryset.model, self.cursor.position), reverse
+            ))
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        has_following = len(rows) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, self.cursor is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param)
+        return self.ordering_fields.get(ordering, self.ordering)
+
+    def after_key(self, key, reverse=False):
+        """Rows after ``key`` in the ordering, before it when ``reverse``"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            step = Q(**{f'{field.lstrip("-")}__{"lt" if descending else "gt"}': key[index]})
+            for prior, value in zip(self.ordering[:index], key):
+                step &= Q(**{prior.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode_key(self, row):
+        return self.key_separator.join(
+            str(getattr(row, field.lstrip('-'))) for field in self.ordering
+        )
+
+    def decode_key(self, model, position):
+        values = (position or '').split(self.key_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.encode_key(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.encode_key(self.page[0])))
+
+    def get_paginated_response(self, data):
+        response = {
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+            },
+            'results': data
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
+
+
+class PaginationActor(LimitOffsetPagination):
+    """Actor pages selected with ``?limit=`` and ``?offset=``
+
+    """
+    default_limit = 20
+    max_limit = 100
+
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -46,3 +169,227 @@ class MovieFilter(FilterSet):
     class Meta:
         model = Movie
         fields = ['genres', 'year']
+
+    def cache_key(self):
+        """Cleaned filter values in a canonical form, the same for equivalent queries
+
+        """
+        parts = []
+        for name, value in sorted(self.form.cleaned_data.items()):
+            if isinstance(value, slice):
+                value = '' if value.start is None and value.stop is None else f'{value.start}-{value.stop}'
+            elif isinstance(value, (list, tuple)):
+                value = ','.join(sorted(set(map(str, value))))
+            if value:
+                parts.append((name, str(value)))
+        return urlencode(parts)
+
+    def queryset_without(self, name):
+        """Queryset filtered by every filter except the given one
+
+        """
+        queryset = self.queryset
+        for filter_name, value in self.form.cleaned_data.items():
+            if filter_name != name:
+                queryset = self.filters[filter_name].filter(queryset, value)
+        return queryset
+
+    def facets(self):
+        """Movie counts per genre and per year for the current filter state
+
+        Each facet ignores its own filter, so the counts show what selecting
+        another value would give. One grouped query per facet.
+        """
+        genres = Movie.genres.through.objects.filter(
+            movie__in=self.queryset_without('genres').order_by().values('pk')
+        ).values('genre__name').annotate(count=Count('movie', distinct=True)).order_by('genre__name')
+        years = self.queryset_without('year').order_by().values('year').annotate(
+            count=Count('pk', distinct=True)
+        ).order_by('year')
+        return {
+            'genres': [{'name': row['genre__name'], 'count': row['count']} for row in genres],
+            'year': [{'year': row['year'], 'count': row['count']} for row in years],
+        }
+
+
+def middle_star_expression(total, count):
+    """Average star for the given sum and count expressions, NULL without votes
+
+    """
+    return Cast(total, FloatField()) / NullIf(count, 0)
+
+
+def apply_rating_delta(movie_id, count_delta, sum_delta):
+    """Shift stored rating aggregates of a movie in a single UPDATE
+
+    """
+    count = F('rating_count') + count_delta
+    total = F('rating_sum') + sum_delta
+    Movie.objects.filter(pk=movie_id).update(
+        rating_count=count,
+        rating_sum=total,
+        middle_star=middle_star_expression(total, count),
+    )
+
+
+def rebuild_rating_aggregates(movies=None):
+    """Recompute stored rating aggregates from the ratings table
+
+    """
+    if movies is None:
+        movies = Movie.objects.all()
+    ratings = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    count = Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), 0)
+    total = Coalesce(Subquery(ratings.annotate(s=Sum('star__value')).values('s')), 0)
+    return movies.update(
+        rating_count=count,
+        rating_sum=total,
+        middle_star=middle_star_expression(total, count),
+    )
+
+
+def get_ratings(ip, movie_ids):
+    """Star values one ip gave to the given movies, None for unrated ones
+
+    One query on the unique (ip, movie) index.
+    """
+    stars = dict(Rating.objects.filter(
+        ip=ip, movie_id__in=movie_ids
+    ).values_list('movie_id', 'star__value'))
+    return {pk: stars.get(pk) for pk in movie_ids}
+
+
+RATING_UPSERT_BATCH_SIZE = 300
+
+
+def upsert_ratings(ip, stars):
+    """Insert or overwrite votes of one ip with INSERT ... ON CONFLICT
+
+    ``stars`` maps movie ids to rating star ids.
+    """
+    qn = connection.ops.quote_name
+    ip_column = qn(Rating._meta.get_field('ip').column)
+    movie_column = qn(Rating._meta.get_field('movie').column)
+    star_column = qn(Rating._meta.get_field('star').column)
+    rows = list(stars.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), RATING_UPSERT_BATCH_SIZE):
+            batch = rows[start:start + RATING_UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {qn(Rating._meta.db_table)} '
+                f'({ip_column}, {movie_column}, {star_column}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({ip_column}, {movie_column}) '
+                f'DO UPDATE SET {star_column} = EXCLUDED.{star_column}',
+                [value for movie, star in batch for value in (ip, movie, star)],
+            )
+
+
+def bulk_rate_movies(ip, ratings):
+    """Store many votes of one ip and return a result per item
+
+    Movies and stars are resolved with one query each, all valid votes are
+    written with a bulk upsert and rating aggregates of the affected movies
+    are recomputed in the same transaction. Movies are unique within
+    ``ratings`` (see ``BulkRatingSerializer``).
+    """
+    movie_ids = set(Movie.objects.filter(
+        pk__in={item['movie'] for item in ratings}
+    ).values_list('pk', flat=True))
+    star_ids = set(RatingStar.objects.filter(
+        pk__in={item['star'] for item in ratings}
+    ).values_list('pk', flat=True))
+    results = []
+    stars = {}
+    for item in ratings:
+        result = {'movie': item['movie'], 'star': item['star']}
+        errors = {}
+        if item['movie'] not in movie_ids:
+            errors['movie'] = [f'Invalid pk "{item["movie"]}" - object does not exist.']
+        if item['star'] not in star_ids:
+            errors['star'] = [f'Invalid pk "{item["star"]}" - object does not exist.']
+        if errors:
+            result.update(status='error', errors=errors)
+        else:
+            stars[item['movie']] = item['star']
+        results.append(result)
+    if not stars:
+        return results
+    with transaction.atomic():
+        existing = set(Rating.objects.select_for_update().filter(
+            ip=ip, movie__in=list(stars)
+        ).values_list('movie', flat=True))
+        upsert_ratings(ip, stars)
+        rebuild_rating_aggregates(Movie.objects.filter(pk__in=list(stars)))
+        invalidate_after_commit(stars)
+    for result in results:
+        if 'status' not in result:
+            result['status'] = 'updated' if result['movie'] in existing else 'created'
+    return results
+
+
+def with_reply_counts(reviews):
+    """Annotate ``reply_count``, all replies of each review at any depth
+
+    Each count is one range scan of the materialized path index.
+    """
+    replies = Review.objects.filter(
+        movie=OuterRef('movie'), path__gt=OuterRef('path'),
+        path__lt=Concat(OuterRef('path'), Value('~')),
+    ).order_by().values('movie').annotate(c=Count('pk')).values('c')
+    return reviews.annotate(reply_count=Coalesce(Subquery(replies), 0))
+
+
+def movie_people(movie_ids):
+    """Ids of the actors and directors of the movies"""
+    return list(
+        Movie.actors.through.objects.filter(movie_id__in=movie_ids).values_list('actor_id', flat=True).union(
+            Movie.directors.through.objects.filter(movie_id__in=movie_ids).values_list('actor_id', flat=True)
+        )
+    )
+
+
+def published_movie_count(through):
+    """Published movies linked to the outer actor through an m2m table
+
+    """
+    links = through.objects.filter(
+        actor=OuterRef('pk'), movie__draft=False
+    ).order_by().values('actor').annotate(c=Count('pk')).values('c')
+    return Coalesce(Subquery(links), 0)
+
+
+FILMOGRAPHY_COUNTS = {
+    'actor_movie_count': Movie.actors.through,
+    'director_movie_count': Movie.directors.through,
+}
+# Serializer field: (relation, attribute of the prefetched movies)
+FILMOGRAPHY_MOVIES = {
+    'movies': ('film_actor', 'published_actor_movies'),
+    'directed': ('film_director', 'published_director_movies'),
+}
+
+
+def with_filmography_counts(actors, fields=tuple(FILMOGRAPHY_COUNTS)):
+    """Annotate counts of published movies as actor and as director
+
+    ``fields`` limits the annotations to the counts a response shows.
+    """
+    return actors.annotate(**{
+        name: published_movie_count(FILMOGRAPHY_COUNTS[name])
+        for name in fields if name in FILMOGRAPHY_COUNTS
+    })
+
+
+def with_filmography(actors, fields=(*FILMOGRAPHY_COUNTS, *FILMOGRAPHY_MOVIES)):
+    """Filmography counts and compact published movies, one prefetch per relation
+
+    Movies are stored in ``published_actor_movies`` and
+    ``published_director_movies``, newest first. ``fields`` limits the
+    counts and prefetches to those a response shows.
+    """
+    movies = Movie.objects.filter(draft=False).only('id', 'title', 'year', 'url').order_by('-year', 'id')
+    return with_filmography_counts(actors, fields).prefetch_related(*(
+        Prefetch(relation, queryset=movies, to_attr=attribute)
+        for name, (relation, attribute) in FILMOGRAPHY_MOVIES.items() if name in fields
+    ))
@@ -0,0 +1,210 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import (
+    bump_catalog_version, bump_versions, invalidate_after_commit, invalidate_movie_detail,
+    movies_changed
+)
+from .cards import expire_movie_cards
+from .images import enqueue_variants
+from .models import (
+    REVIEW_PATH_STEP, Actor, Category, Genre, Movie, MovieShots, Rating, RatingStar, Review,
+    review_path_segment
+)
+from .search import delete_from_search_index, update_search_index
+from .service import movie_people, rebuild_rating_aggregates
+
+
+@receiver(movies_changed)
+def refresh_movies(sender, movie_ids, **kwargs):
+    """Expire cards, drop cached details of changed movies, then start their new versions"""
+    expire_movie_cards(movie_ids)
+    invalidate_movie_detail(*movie_ids)
+    bump_versions('movie', movie_ids)
+
+
+@receiver([post_save, post_delete], sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    invalidate_after_commit([instance.pk])
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_delete, sender=Movie)
+def remember_movie_people(sender, instance, **kwargs):
+    instance._deleted_movie_people = movie_people([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Movie)
+def movie_filmographies_changed(sender, instance, **kwargs):
+    """Filmographies of the movie's actors and directors show its title and status"""
+    actor_ids = getattr(instance, '_deleted_movie_people', None)
+    if actor_ids is None:
+        actor_ids = movie_people([instance.pk])
+    transaction.on_commit(partial(bump_versions, 'actor', actor_ids))
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Rating)
+def movie_child_changed(sender, instance, **kwargs):
+    invalidate_after_commit([instance.movie_id])
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    """Deleting votes (admin, cascades) recomputes the stored aggregates of the movie"""
+    rebuild_rating_aggregates(Movie.objects.filter(pk=instance.movie_id))
+
+
+@receiver(post_save, sender=RatingStar)
+def rating_star_changed(sender, instance, created, **kwargs):
+    """A changed star value shifts the aggregates of every movie rated with it"""
+    if not created:
+        rebuild_rating_aggregates(Movie.objects.filter(
+            pk__in=Rating.objects.filter(star=instance).values('movie_id')
+        ))
+
+
+@receiver(post_delete, sender=Review)
+def reroot_review_replies(sender, instance, **kwargs):
+    """Replies of a deleted review become roots, their paths lose its prefix
+
+    Descendants are found by the review's own path segment rather than by
+    its in-memory path, which is stale when an ancestor was deleted and
+    rerooted it after the instance was loaded.
+    """
+    segment = review_path_segment(instance.pk)
+    replies = []
+    for review in Review.objects.filter(movie_id=instance.movie_id, path__contains=segment).only('path'):
+        for start in range(0, len(review.path), REVIEW_PATH_STEP):
+            if review.path[start:start + REVIEW_PATH_STEP] == segment:
+                review.path = review.path[start + REVIEW_PATH_STEP:]
+                replies.append(review)
+                break
+    Review.objects.bulk_update(replies, ['path'])
+
+
+def actor_movies(actor):
+    return Movie.objects.filter(Q(actors=actor) | Q(directors=actor)).distinct()
+
+
+@receiver([post_save, post_delete], sender=Actor)
+def actor_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_versions, 'actor', [instance.pk]))
+    invalidate_after_commit(actor_movies(instance).values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def genre_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+    invalidate_after_commit(
+        Movie.objects.filter(genres=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_after_commit(
+        Movie.objects.filter(category=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if sender is Movie.genres.through and action.startswith('post_'):
+        transaction.on_commit(bump_catalog_version)
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_after_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_after_commit(pk_set)
+    elif action == 'pre_clear':
+        invalidate_after_commit(sender.objects.filter(
+            **{instance._meta.model_name: instance}
+        ).values_list('movie_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+def filmography_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        actor_ids = [instance.pk] if reverse else list(pk_set)
+    elif action == 'pre_clear':
+        instance._filmography_actor_ids = [instance.pk] if reverse else list(
+            sender.objects.filter(movie=instance).values_list('actor_id', flat=True)
+        )
+        return
+    elif action == 'post_clear':
+        actor_ids = getattr(instance, '_filmography_actor_ids', [])
+    else:
+        return
+    transaction.on_commit(partial(bump_versions, 'actor', actor_ids))
+
+
+@receiver(post_save, sender=Movie)
+def index_movie(sender, instance, **kwargs):
+    update_search_index([instance.pk])
+
+
+@receiver(post_delete, sender=Movie)
+def unindex_movie(sender, instance, **kwargs):
+    delete_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Actor)
+def index_actor_movies(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(
+            Movie.actors.through.objects.filter(actor=instance).values_list('movie_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Actor)
+def remember_actor_search_movies(sender, instance, **kwargs):
+    instance._search_movie_ids = list(
+        Movie.actors.through.objects.filter(actor=instance).values_list('movie_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Actor)
+def index_deleted_actor_movies(sender, instance, **kwargs):
+    """The cascade removed the actor from its movies without ``m2m_changed``"""
+    update_search_index(getattr(instance, '_search_movie_ids', []))
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def index_movie_actors(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            update_search_index([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        update_search_index(pk_set)
+    elif action == 'pre_clear':
+        instance._search_movie_ids = list(
+            sender.objects.filter(actor=instance).values_list('movie_id', flat=True)
+        )
+    elif action == 'post_clear':
+        update_search_index(getattr(instance, '_search_movie_ids', []))
+
+
+@receiver(post_save, sender=Movie)
+def movie_poster_variants(sender, instance, **kwargs):
+    enqueue_variants(instance.poster, movie_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Actor)
+def actor_image_variants(sender, instance, **kwargs):
+    enqueue_variants(
+        instance.image, version=('actor', [instance.pk]),
+        movie_ids=actor_movies(instance).values_list('pk', flat=True),
+    )
+
+
+@receiver(post_save, sender=MovieShots)
+def movie_shot_variants(sender, instance, **kwargs):
+    enqueue_variants(instance.image)
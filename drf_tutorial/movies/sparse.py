@@ -0,0 +1,101 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def query_list(request, name):
+    """Comma separated query parameter as a list, None when it is absent
+
+    """
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class SparseFieldsMixin:
+    """Serializer trimmed by the ``fields``, ``omit`` and ``expand`` arguments
+
+    Relations listed in ``expandable_fields`` are rendered as primary keys
+    when ``expand`` is given and does not name them.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, omit=(), expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in set(omit) & set(self.fields):
+            self.fields.pop(name)
+        if expand is not None:
+            for name in self.expandable_fields:
+                if name in self.fields and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        many=True, read_only=True
+                    )
+
+
+def sparse_queryset(queryset, fields):
+    """Queryset loading only the columns and relations the given serializer fields read
+
+    Concrete columns go to ``only()``, foreign keys rendered as objects to
+    ``select_related`` and to-many relations to ``prefetch_related``. Those
+    rendered as primary keys prefetch only the key columns.
+    """
+    opts = queryset.model._meta
+    only, related, prefetch = {opts.pk.name}, [], []
+    for field in fields.values():
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if model_field.many_to_many or model_field.one_to_many:
+            if isinstance(field, serializers.ManyRelatedField) and isinstance(
+                field.child_relation, serializers.PrimaryKeyRelatedField
+            ):
+                key_columns = ['pk']
+                if model_field.one_to_many:
+                    key_columns.append(model_field.field.name)
+                prefetch.append(Prefetch(
+                    field.source,
+                    queryset=model_field.related_model.objects.only(*key_columns),
+                ))
+            else:
+                prefetch.append(field.source)
+        elif model_field.is_relation:
+            only.add(field.source)
+            if not isinstance(field, serializers.PrimaryKeyRelatedField):
+                related.append(field.source)
+        else:
+            only.add(field.source)
+    return queryset.only(*only).select_related(*related).prefetch_related(*prefetch)
+
+
+class SparseFieldsViewMixin:
+    """``?fields=`` and ``?expand=`` for views with sparse serializers
+
+    """
+
+    def get_sparse_params(self):
+        params = {}
+        if getattr(self, 'request', None) is not None:
+            for name in ('fields', 'expand'):
+                value = query_list(self.request, name)
+                if value is not None:
+                    params[name] = value
+        return params
+
+    def is_sparse(self):
+        return bool(self.get_sparse_params())
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            kwargs = {**self.get_sparse_params(), **kwargs}
+        return super().get_serializer(*args, **kwargs)
+
+    def sparse_queryset(self, queryset):
+        """Queryset trimmed to the fields of this request's serializer
+
+        """
+        return sparse_queryset(queryset, self.get_serializer().fields)
@@ -1,3 +1,1587 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlsplit
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+
+from drf_tutorial import yasg
+
+from .cache import bump_versions, get_movie_detail
+from .cards import detail_data, rebuild_movie_cards
+from .checks import shared_cache_check
+from . import urls as movies_urls
+from .async_views import call_view
+from .benchmark.catalog import generate_catalog
+from .benchmark.harness import default_routes, run_benchmark
+from .benchmark.load import run_load
+from .dbpool import ConnectionPool, PoolTimeout, pools, release_connections
+from .export import EXPORT_FIELDS, iter_movies
+from .images import FORMATS, VARIANTS, build_variants, missing_variants, render_variants, variant_targets
+from .instrumentation import RequestMetrics, current_metrics, registry
+from .jobs import claim_jobs, enqueue, run_pending
+from .models import (
+    Actor, Category, Genre, Job, Movie, MovieCard, Rating, RatingStar, Review, review_path_segment
+)
+from .renderers import ORJSONRenderer
+from .routers import PRIMARY_COOKIE, ReplicaRouter, RoutingState, current_routing
+from .serializers import ActorListSerializer, CreateRatingSerializer, MovieListSerializer
+from .service import rebuild_rating_aggregates, with_filmography_counts, with_reply_counts
+from .throttling import TokenBucketThrottle
+
+
+class MovieDetailReviewsTest(APITestCase):
+    """Review tree of the movie detail endpoint
+
+    """
+
+    def setUp(self):
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+
+    def add_thread(self, depth):
+        parent = None
+        for level in range(depth):
+            parent = Review.objects.create(
+                email='user@example.com', name=f'user {level}', text=f'text {level}',
+                parent=parent, movie=self.movie,
+            )
+
+    def get_detail(self):
+        cache.clear()
+        return self.client.get(f'/movie/{self.movie.pk}/')
+
+    def test_nested_children(self):
+        self.add_thread(3)
+        reviews = self.get_detail().json()['reviews']
+        self.assertEqual(reviews, [{
+            'name': 'user 0', 'text': 'text 0', 'children': [{
+                'name': 'user 1', 'text': 'text 1', 'children': [{
+                    'name': 'user 2', 'text': 'text 2', 'children': [],
+                }],
+            }],
+        }])
+
+    def test_query_count_does_not_depend_on_depth(self):
+        self.add_thread(1)
+        with CaptureQueriesContext(connection) as shallow:
+            self.get_detail()
+        self.add_thread(20)
+        with self.assertNumQueries(len(shallow)):
+            self.get_detail()
+
+
+class ReviewPathTest(APITestCase):
+    """Materialized paths of threaded reviews
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+
+    def reply(self, parent=None, movie=None):
+        response = self.client.post('/review/', {
+            'email': 'user@example.com', 'name': 'user', 'text': 'text',
+            'movie': (movie or self.movie).pk, 'parent': parent.pk if parent else '',
+        })
+        return Review.objects.filter(pk=response.json().get('id')).first(), response
+
+    def test_subtree_and_reply_counts(self):
+        root, _ = self.reply()
+        first, _ = self.reply(root)
+        second, _ = self.reply(root)
+        nested, _ = self.reply(first)
+        other, _ = self.reply()
+        self.assertEqual(nested.path, root.path + first.path[-10:] + nested.path[-10:])
+        self.assertEqual(nested.depth, 2)
+        self.assertEqual(list(root.subtree()), [root, first, nested, second])
+        counts = dict(with_reply_counts(Review.objects.all()).values_list('pk', 'reply_count'))
+        self.assertEqual(counts, {root.pk: 3, first.pk: 1, second.pk: 0, nested.pk: 0, other.pk: 0})
+
+    def test_replies_of_deleted_review_become_roots(self):
+        root, _ = self.reply()
+        first, _ = self.reply(root)
+        nested, _ = self.reply(first)
+        root.delete()
+        first.refresh_from_db()
+        self.assertIsNone(first.parent_id)
+        self.assertEqual(list(first.subtree()), [first, Review.objects.get(pk=nested.pk)])
+        self.assertEqual(first.depth, 0)
+
+    def test_deleting_review_with_its_reply_reroots_the_rest(self):
+        root, _ = self.reply()
+        first, _ = self.reply(root)
+        nested, _ = self.reply(first)
+        deeper, _ = self.reply(nested)
+        Review.objects.filter(pk__in=[root.pk, first.pk]).delete()
+        nested.refresh_from_db()
+        self.assertEqual(nested.depth, 0)
+        self.assertEqual(list(nested.subtree()), [nested, Review.objects.get(pk=deeper.pk)])
+
+    def test_deleting_reviews_loaded_before_a_reroot(self):
+        root, _ = self.reply()
+        first, _ = self.reply(root)
+        nested, _ = self.reply(first)
+        stale = list(Review.objects.filter(pk__in=[root.pk, first.pk]).order_by('pk'))
+        for review in stale:
+            review.delete()
+        nested.refresh_from_db()
+        self.assertEqual(nested.path, review_path_segment(nested.pk))
+
+    def test_too_deep_reply_is_rejected(self):
+        parent = Review.objects.create(
+            email='user@example.com', name='user', text='text', movie=self.movie,
+            path='0' * (Review._meta.get_field('path').max_length - 5),
+        )
+        review, response = self.reply(parent)
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValidationError):
+            Review.objects.create(
+                email='user@example.com', name='user', text='text', movie=self.movie, parent=parent,
+            )
+
+    def test_admin_cannot_move_a_review(self):
+        root, _ = self.reply()
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(staff)
+        response = self.client.get(f'/admin/movies/review/{root.pk}/change/')
+        self.assertEqual(set(response.context['adminform'].form.fields), {'text'})
+
+    def test_reply_to_other_movie_is_rejected(self):
+        other = Movie.objects.create(title='Other', description='Description', country='USA', url='other')
+        root, _ = self.reply()
+        review, response = self.reply(root, movie=other)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+
+
+class MovieDetailCacheTest(APITestCase):
+    """Cached movie detail and its invalidation
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+        self.url = f'/movie/{self.movie.pk}/'
+
+    def test_cached_response_is_reused(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['title'], 'Movie')
+
+    def test_rating_user_is_per_client(self):
+        star = RatingStar.objects.create(value=5)
+        Rating.objects.create(ip='10.0.0.1', star=star, movie=self.movie)
+        self.assertTrue(self.client.get(self.url, REMOTE_ADDR='10.0.0.1').json()['rating_user'])
+        self.assertFalse(self.client.get(self.url, REMOTE_ADDR='10.0.0.2').json()['rating_user'])
+
+    def test_invalidated_on_related_changes(self):
+        actor = Actor.objects.create(name='Actor', description='Description')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.actors.add(actor)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            actor.name = 'Renamed'
+            actor.save()
+        self.assertEqual(self.client.get(self.url).json()['actors'][0]['name'], 'Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                email='user@example.com', name='user', text='text', movie=self.movie
+            )
+        self.assertEqual(len(self.client.get(self.url).json()['reviews']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.draft = True
+            self.movie.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class QueryPlanTest(APITestCase):
+    """Indexes used by the hot query shapes, checked with EXPLAIN
+
+    """
+
+    def setUp(self):
+        self.genre = Genre.objects.create(name='Drama', description='Description', url='drama')
+        self.star = RatingStar.objects.create(value=5)
+        for year in range(1990, 2020):
+            movie = Movie.objects.create(
+                title=f'Movie {year}', description='Description', country='USA',
+                url=f'movie-{year}', year=year, draft=year % 5 == 0,
+            )
+            movie.genres.add(self.genre)
+        self.movie = movie
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, plan, *indexes):
+        self.assertTrue(any(index in plan for index in indexes), plan)
+
+    def selects(self, action):
+        """SELECTs run by ``action``, with their parameters, as executed"""
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            action()
+        return [(sql, params) for sql, params in queries if sql.startswith('SELECT')]
+
+    def select_from(self, queries, table, clause=''):
+        return next(
+            (sql, params) for sql, params in queries
+            if sql.split(' FROM ')[1].startswith(f'"{table}"') and clause in sql
+        )
+
+    def movie_list_queries(self, **params):
+        """Queries the list endpoint runs, its card and rating lookups checked on the way"""
+        rebuild_movie_cards(Movie.objects.values_list('pk', flat=True))
+        cache.clear()
+        queries = self.selects(lambda: self.client.get('/movie/', params))
+        card_sql, card_params = self.select_from(queries, 'movies_moviecard')
+        self.assertUsesIndex(
+            self.explain(card_sql, card_params),
+            'movies_moviecard_pkey', 'sqlite_autoindex_movies_moviecard',
+        )
+        rating_sql, rating_params = self.select_from(queries, 'movies_rating')
+        # SQLite keeps the unique constraint as an automatic table index
+        self.assertUsesIndex(
+            self.explain(rating_sql, rating_params),
+            'unique_rating_ip_movie', 'sqlite_autoindex_movies_rating',
+        )
+        return queries
+
+    def test_movie_year_range_uses_published_year_id_index(self):
+        queries = self.movie_list_queries(year_min=2000, year_max=2010)
+        self.assertUsesIndex(
+            self.explain(*self.select_from(queries, 'movies_movie', 'LIMIT')),
+            'movie_published_year_id_idx',
+        )
+
+    def test_movie_genres_filter_uses_genre_name_index(self):
+        queries = self.movie_list_queries(genres='Drama,Comedy')
+        self.assertUsesIndex(
+            self.explain(*self.select_from(queries, 'movies_movie', 'LIMIT')), 'genre_name_idx'
+        )
+
+    def test_review_subtree_uses_path_index(self):
+        review = Review.objects.create(
+            email='user@example.com', name='user', text='text', movie=self.movie
+        )
+        sql, params = review.subtree().query.sql_with_params()
+        self.assertUsesIndex(self.explain(sql, params), 'review_movie_path_idx')
+
+    def test_rating_lookup_uses_unique_ip_movie_index(self):
+        serializer = CreateRatingSerializer(data={'star': self.star.pk, 'movie': self.movie.pk})
+        serializer.is_valid(raise_exception=True)
+        queries = self.selects(lambda: serializer.save(ip='127.0.0.1'))
+        # SQLite keeps the unique constraint as an automatic table index
+        self.assertUsesIndex(
+            self.explain(*self.select_from(queries, 'movies_rating')),
+            'unique_rating_ip_movie', 'sqlite_autoindex_movies_rating',
+        )
+
+
+class MovieSearchTest(APITestCase):
+    """Full-text movie search
+
+    """
+
+    def setUp(self):
+        self.actor = Actor.objects.create(name='Keanu Reeves', description='Description')
+        self.matrix = Movie.objects.create(
+            title='The Matrix', tagline='Free your mind', description='<p>A hacker</p>',
+            country='USA', url='matrix',
+        )
+        self.speed = Movie.objects.create(
+            title='Speed', tagline='Matrix of danger', description='Bus',
+            country='USA', url='speed',
+        )
+        self.speed.actors.add(self.actor)
+
+    def search(self, query):
+        response = self.client.get('/movie/search/', {'q': query})
+        return [movie['title'] for movie in response.json()['results']]
+
+    def test_title_ranked_above_tagline(self):
+        self.assertEqual(self.search('matrix'), ['The Matrix', 'Speed'])
+
+    def test_index_follows_actor_changes(self):
+        self.assertEqual(self.search('keanu'), ['Speed'])
+        self.actor.name = 'John Wick'
+        self.actor.save()
+        self.assertEqual(self.search('keanu'), [])
+        self.speed.actors.remove(self.actor)
+        self.assertEqual(self.search('wick'), [])
+
+    def test_limit_is_clamped(self):
+        for limit, count in (('0', 1), ('-1', 1), ('1', 1), ('1000', 2), ('x', 2)):
+            with self.subTest(limit=limit):
+                response = self.client.get('/movie/search/', {'q': 'matrix', 'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), count)
+
+    def test_deleted_actor_leaves_the_index(self):
+        self.actor.delete()
+        self.assertEqual(self.search('keanu'), [])
+
+    def test_generated_catalog_is_searchable(self):
+        generate_catalog(movies=3, actors=2, genres=1, categories=1, reviews=0, ratings=0, seed=1)
+        movie = Movie.objects.order_by('-pk').first()
+        self.assertIn(movie.title, self.search(movie.title))
+
+
+class MovieFacetsTest(APITestCase):
+    """Genre and year counts of the movie list, cached per filter combination
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.drama = Genre.objects.create(name='Drama', description='Description', url='drama')
+        self.comedy = Genre.objects.create(name='Comedy', description='Description', url='comedy')
+        for year, genres in ((2001, [self.drama]), (2002, [self.drama, self.comedy]), (2003, [self.comedy])):
+            movie = Movie.objects.create(
+                title=f'Movie {year}', description='Description', country='USA', url=f'movie-{year}', year=year,
+            )
+            movie.genres.set(genres)
+
+    def facets(self, query=''):
+        return self.client.get(f'/movie/?facets=1{query}').json()['facets']
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets('&genres=Comedy&year_min=2002')
+        self.assertEqual(facets['genres'], [{'name': 'Comedy', 'count': 2}, {'name': 'Drama', 'count': 1}])
+        self.assertEqual(facets['year'], [{'year': 2002, 'count': 1}, {'year': 2003, 'count': 1}])
+
+    def test_equivalent_filters_share_a_cache_entry(self):
+        first = self.facets('&genres=Drama,Comedy')
+        with mock.patch('movies.views.MovieFilter.facets') as facets:
+            second = self.facets('&genres=Comedy,Drama')
+        facets.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_counts_follow_catalog_changes(self):
+        self.assertEqual(len(self.facets()['year']), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.create(title='New', description='Description', country='USA', url='new', year=2004)
+        self.assertEqual(self.facets()['year'][-1], {'year': 2004, 'count': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comedy.delete()
+        self.assertEqual(self.facets()['genres'], [{'name': 'Drama', 'count': 2}])
+
+
+class MovieCardTest(APITestCase):
+    """Movie cards rebuilt on writes and served by the catalog endpoints
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie = Movie.objects.create(
+                title='Movie', description='Description', country='USA', url='movie'
+            )
+        run_pending()
+        self.star = RatingStar.objects.create(value=4)
+
+    def test_list_is_served_from_cards(self):
+        MovieCard.objects.filter(pk=self.movie.pk).update(list_data={
+            **MovieCard.objects.get(pk=self.movie.pk).list_data, 'title': 'From card'
+        })
+        results = self.client.get('/movie/').json()['results']
+        self.assertEqual(results[0]['title'], 'From card')
+
+    def test_rating_expires_card_and_queues_rebuild(self):
+        for star in (self.star, RatingStar.objects.create(value=2)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/rating/', {'star': star.pk, 'movie': self.movie.pk})
+        self.assertFalse(MovieCard.objects.filter(pk=self.movie.pk).exists())
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+        result = self.client.get('/movie/').json()['results'][0]
+        self.assertEqual((result['middle_star'], result['rating_user']), (2.0, True))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(MovieCard.objects.get(pk=self.movie.pk).list_data['middle_star'], 2.0)
+
+    def test_concurrent_rebuilds_of_one_movie(self):
+        rebuild_movie_cards([self.movie.pk])
+        rebuild_movie_cards([self.movie.pk])
+        self.assertEqual(MovieCard.objects.filter(pk=self.movie.pk).count(), 1)
+
+    def test_unpublished_movie_loses_card(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.draft = True
+            self.movie.save()
+        self.assertFalse(MovieCard.objects.filter(pk=self.movie.pk).exists())
+
+    def test_list_pages_are_ordered_by_id(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/movie/')
+        page = next(query['sql'] for query in queries if 'LIMIT' in query['sql'])
+        self.assertIn('ORDER BY "movies_movie"."id" ASC', page)
+
+    def test_detail_without_card_orders_reviews_by_path(self):
+        MovieCard.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/movie/{self.movie.pk}/')
+        self.assertEqual(response.status_code, 200)
+        reviews = next(query['sql'] for query in queries if 'FROM "movies_review"' in query['sql'])
+        self.assertIn('ORDER BY "movies_review"."path" ASC', reviews)
+        self.assertEqual(self.client.get('/movie/0/').status_code, 404)
+
+
+class SparseFieldsTest(APITestCase):
+    """``?fields=`` and ``?expand=`` on the movie and actor endpoints
+
+    """
+
+    def setUp(self):
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+        self.actor = Actor.objects.create(name='Actor', age=40, description='Long description')
+        self.movie.actors.add(self.actor)
+        self.movie.directors.add(self.actor)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_detail_fields_skip_relations(self):
+        data, sql = self.get(f'/movie/{self.movie.pk}/?fields=id,title')
+        self.assertEqual(data, {'id': self.movie.pk, 'title': 'Movie'})
+        for table in ('movies_actor', 'movies_review', 'movies_rating', 'description'):
+            self.assertNotIn(table, sql)
+
+    def test_unexpanded_relations_are_ids(self):
+        data, sql = self.get(
+            f'/movie/{self.movie.pk}/?fields=title,actors,directors&expand=actors'
+        )
+        self.assertEqual(data['actors'][0]['description'], 'Long description')
+        self.assertEqual(data['directors'], [self.actor.pk])
+        self.assertNotIn('movies_review', sql)
+
+    def test_list_and_actor_fields(self):
+        data, _ = self.get('/movie/?fields=id,title')
+        self.assertEqual(data['results'], [{'id': self.movie.pk, 'title': 'Movie'}])
+        with self.assertNumQueries(1):
+            data, sql = self.get(f'/actors/{self.actor.pk}?fields=name')
+        self.assertEqual(data, {'name': 'Actor'})
+        self.assertNotIn('description', sql)
+
+    def test_actor_filmography_only_when_requested(self):
+        with self.assertNumQueries(1):
+            data, sql = self.get(f'/actors/{self.actor.pk}?fields=id,name')
+        self.assertNotIn('movies_movie', sql)
+        with self.assertNumQueries(2):
+            data, _ = self.get(f'/actors/{self.actor.pk}?fields=name,directed,director_movie_count')
+        self.assertEqual(data['director_movie_count'], 1)
+        self.assertEqual([movie['id'] for movie in data['directed']], [self.movie.pk])
+        with self.assertNumQueries(2):
+            data, sql = self.get('/actors/?fields=id,name')
+        self.assertEqual(data['results'], [{'id': self.actor.pk, 'name': 'Actor'}])
+        self.assertNotIn('movies_movie', sql)
+        with self.assertNumQueries(2):
+            data, _ = self.get('/actors/?omit=director_movie_count')
+        self.assertEqual(data['results'][0]['actor_movie_count'], 1)
+
+
+class ConditionalGetTest(APITestCase):
+    """ETag and Last-Modified validators of the catalog endpoints
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie = Movie.objects.create(
+                title='Movie', description='Description', country='USA', url='movie'
+            )
+            self.actor = Actor.objects.create(name='Actor', age=40, description='Description')
+        self.star = RatingStar.objects.create(value=4)
+
+    def test_not_modified_without_queries(self):
+        for url in ('/movie/', f'/movie/{self.movie.pk}/', '/actors/', f'/actors/{self.actor.pk}'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_etag(self):
+        list_etag = self.client.get('/movie/')['ETag']
+        detail_etag = self.client.get(f'/movie/{self.movie.pk}/')['ETag']
+        actor_etag = self.client.get(f'/actors/{self.actor.pk}')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/rating/', {'star': self.star.pk, 'movie': self.movie.pk})
+        response = self.client.get('/movie/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/movie/{self.movie.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/actors/{self.actor.pk}', HTTP_IF_NONE_MATCH=actor_etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.actor.save()
+        response = self.client.get(f'/actors/{self.actor.pk}', HTTP_IF_NONE_MATCH=actor_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        response = self.client.get(f'/movie/{self.movie.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/rating/', {'star': self.star.pk, 'movie': self.movie.pk})
+        response = self.client.get(
+            f'/movie/{self.movie.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class ListFastPathTest(APITestCase):
+    """values() fast path of the list serializers and the orjson renderer
+
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name='Drama', description='Drama', url='drama')
+        for number in range(3):
+            movie = Movie.objects.create(
+                title=f'Movie {number}', tagline='Tagline \u2028', description='Description',
+                country='USA', url=f'movie-{number}', category=category,
+                middle_star=number or None,
+            )
+            Actor.objects.create(name=f'Actor {number}', age=40, description='Description')
+            Rating.objects.create(ip='127.0.0.1', star=RatingStar.objects.create(value=number), movie=movie)
+
+    def assertSameOutput(self, serializer_class, queryset):
+        fields = ListSerializer(child=serializer_class()).to_representation(list(queryset))
+        self.assertEqual(serializer_class(queryset, many=True).data, fields)
+        self.assertEqual(serializer_class(list(queryset.values()), many=True).data, fields)
+        return fields
+
+    def test_values_match_fields(self):
+        movies = self.assertSameOutput(
+            MovieListSerializer, Movie.objects.annotate(rating_user=Count('ratings')).order_by('pk')
+        )
+        self.assertEqual([movie['rating_user'] for movie in movies], [True] * 3)
+        self.assertSameOutput(ActorListSerializer, with_filmography_counts(Actor.objects.order_by('pk')))
+
+    def test_orjson_renderer_matches_stdlib(self):
+        data = self.client.get('/movie/?limit=10').json()
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_orjson_renderer_is_opt_in(self):
+        self.assertIsInstance(self.client.get('/movie/').accepted_renderer, ORJSONRenderer)
+        self.assertIsInstance(self.client.get('/actors/').accepted_renderer, ORJSONRenderer)
+        response = self.client.get(f'/rating/mine/?movies={Movie.objects.first().pk}')
+        self.assertIs(type(response.accepted_renderer), JSONRenderer)
+
+
+class ActorFilmographyTest(APITestCase):
+    """Paginated actors with their published filmography
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.actor = Actor.objects.create(name='Actor', age=40, description='Description')
+        Actor.objects.create(name='Other', age=30, description='Description')
+        for year in (2001, 2002, 2003):
+            movie = Movie.objects.create(
+                title=f'Movie {year}', description='Description', country='USA',
+                url=f'movie-{year}', year=year, draft=year == 2003,
+            )
+            movie.actors.add(self.actor)
+        movie.directors.add(self.actor)
+        self.movie = Movie.objects.get(year=2002)
+        self.movie.directors.add(self.actor)
+
+    def test_list_is_paginated_with_counts(self):
+        data = self.client.get('/actors/?limit=1').json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            {key: data['results'][0][key] for key in ('name', 'actor_movie_count', 'director_movie_count')},
+            {'name': 'Actor', 'actor_movie_count': 2, 'director_movie_count': 1},
+        )
+        self.assertIsNotNone(data['next'])
+
+    def test_detail_filmography_queries_per_relation(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(f'/actors/{self.actor.pk}').json()
+        self.assertEqual([movie['year'] for movie in data['movies']], [2002, 2001])
+        self.assertEqual(data['directed'], [{
+            'id': self.movie.pk, 'title': 'Movie 2002', 'year': 2002, 'url': 'movie-2002',
+        }])
+
+    def test_movie_change_refreshes_filmography(self):
+        etag = self.client.get(f'/actors/{self.actor.pk}')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.title = 'Renamed'
+            self.movie.save()
+        response = self.client.get(f'/actors/{self.actor.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', [movie['title'] for movie in response.json()['directed']])
+
+    def test_admin_publishing_refreshes_filmography(self):
+        etag = self.client.get(f'/actors/{self.actor.pk}')['ETag']
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(staff)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post('/admin/movies/movie/', {
+                'action': 'publish', '_selected_action': [Movie.objects.get(year=2003).pk],
+            })
+        self.assertTrue(callbacks)
+        response = self.client.get(f'/actors/{self.actor.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['year'] for movie in response.json()['movies']], [2003, 2002, 2001])
+
+
+class MyRatingsTest(APITestCase):
+    """Batch lookup of the caller's stars and the shared catalog mode
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies = [
+                Movie.objects.create(
+                    title=f'Movie {number}', description='Description', country='USA',
+                    url=f'movie-{number}',
+                )
+                for number in range(3)
+            ]
+        star = RatingStar.objects.create(value=4)
+        Rating.objects.create(ip='127.0.0.1', star=star, movie=self.movies[0])
+        Rating.objects.create(ip='10.0.0.1', star=star, movie=self.movies[1])
+
+    def test_stars_in_one_query(self):
+        ids = ','.join(str(movie.pk) for movie in self.movies)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/rating/mine/?movies={ids}')
+        self.assertEqual(response.json()['ratings'], {
+            str(self.movies[0].pk): 4, str(self.movies[1].pk): None, str(self.movies[2].pk): None,
+        })
+        self.assertEqual(self.client.get('/rating/mine/?movies=x').status_code, 400)
+
+    def test_format_suffix(self):
+        response = self.client.get(f'/rating/mine.json?movies={self.movies[0].pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ratings'], {str(self.movies[0].pk): 4})
+
+    def test_shared_mode_omits_rating_user(self):
+        movie = self.movies[0]
+        for url in ('/movie/?shared=1', f'/movie/{movie.pk}/?shared=1'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertNotIn('rating_user', str(response.json()))
+            self.assertNotIn('movies_rating', ' '.join(query['sql'] for query in queries))
+            self.assertIn('public', response['Cache-Control'])
+            other = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(other['ETag'], response['ETag'])
+        self.assertNotEqual(
+            self.client.get('/movie/')['ETag'],
+            self.client.get('/movie/', REMOTE_ADDR='10.0.0.1')['ETag'],
+        )
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'rating': '2/min'},
+})
+class WriteThrottleTest(APITestCase):
+    """Token-bucket throttling of rating writes
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+        self.star = RatingStar.objects.create(value=4)
+
+    def rate(self, ip='127.0.0.1'):
+        return self.client.post(
+            '/rating/', {'star': self.star.pk, 'movie': self.movie.pk}, REMOTE_ADDR=ip
+        )
+
+    def test_rejected_before_database(self):
+        self.assertEqual([self.rate().status_code for _ in range(2)], [201, 201])
+        with self.assertNumQueries(0):
+            response = self.rate()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.rate('10.0.0.1').status_code, 201)
+
+    def test_bucket_refills(self):
+        with mock.patch('movies.throttling.time.time', return_value=1000):
+            self.rate(), self.rate()
+            self.assertEqual(self.rate().status_code, 429)
+        with mock.patch('movies.throttling.time.time', return_value=1031):
+            self.assertEqual(self.rate().status_code, 201)
+            self.assertEqual(self.rate().status_code, 429)
+
+    def test_concurrent_writes_take_one_token_each(self):
+        get_many = cache.get_many
+
+        def slow_get_many(keys):
+            # Widens the window between reading and writing a bucket.
+            # Patched on the class, every thread has its own cache object
+            values = get_many(keys)
+            time.sleep(0.01)
+            return values
+
+        throttle = TokenBucketThrottle()
+        request, view = mock.Mock(method='POST'), mock.Mock(throttle_scope='rating')
+        barrier = threading.Barrier(5)
+        allowed = []
+
+        def write():
+            barrier.wait()
+            allowed.append(throttle.allow_request(request, view))
+
+        with mock.patch.object(TokenBucketThrottle, 'get_idents', return_value=['ip-127.0.0.1']), \
+                mock.patch.object(type(caches['default']), 'get_many', side_effect=slow_get_many):
+            threads = [threading.Thread(target=write) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(allowed), [False, False, False, True, True])
+
+
+class ReplicaRoutingTest(APITestCase):
+    """Catalog reads on a replica, primary after writes, two SQLite databases
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The replica is registered here, after the runner set up the test databases
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        with override_settings(DATABASE_REPLICAS={'replica': 1}):
+            call_command('migrate', database='replica', verbosity=0)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        cache.clear()
+        self.actor = Actor.objects.create(name='Primary', age=40, description='Description')
+        Actor.objects.using('replica').create(
+            pk=self.actor.pk, name='Replica', age=40, description='Description'
+        )
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+        self.star = RatingStar.objects.create(value=4)
+        # Versions older than the replica lag window, unless a test says otherwise
+        patcher = mock.patch('movies.conditional.time')
+        self.clock = patcher.start().time
+        self.clock.return_value = time.time() + 3600
+        self.addCleanup(patcher.stop)
+
+    def actor_name(self):
+        return self.client.get(f'/actors/{self.actor.pk}').json()['name']
+
+    @override_settings(DATABASE_REPLICAS={'replica': 1})
+    def test_fresh_versions_are_read_from_primary(self):
+        self.clock.return_value = time.time()
+        bump_versions('actor', [self.actor.pk])
+        self.assertEqual(self.actor_name(), 'Primary')
+        self.clock.return_value = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        self.assertEqual(self.actor_name(), 'Replica')
+
+    @override_settings(DATABASE_REPLICAS={'replica': 1})
+    def test_facets_are_computed_on_primary(self):
+        Movie.objects.using('replica').create(
+            pk=self.movie.pk + 1, title='Stale', description='Description', country='USA',
+            url='stale', year=1999,
+        )
+        self.movie.year = 2020
+        self.movie.save()
+        facets = self.client.get('/movie/?facets=1&shared=1').json()['facets']
+        self.assertEqual(facets['year'], [{'year': 2020, 'count': 1}])
+
+    @override_settings(DATABASE_REPLICAS={'replica': 1})
+    def test_catalog_reads_go_to_replica_until_a_write(self):
+        self.assertEqual(self.actor_name(), 'Replica')
+        response = self.client.post('/rating/', {'star': self.star.pk, 'movie': self.movie.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(self.actor_name(), 'Primary')
+        self.client.cookies.pop(PRIMARY_COOKIE)
+        self.assertEqual(self.actor_name(), 'Replica')
+
+    @override_settings(DATABASE_REPLICAS={'replica': 1})
+    def test_detail_cache_is_filled_from_primary(self):
+        Movie.objects.using('replica').create(
+            pk=self.movie.pk, title='Stale', description='Description', country='USA', url='movie'
+        )
+        self.assertEqual(self.client.get(f'/movie/{self.movie.pk}/').json()['title'], 'Movie')
+        self.assertEqual(get_movie_detail(self.movie.pk)['title'], 'Movie')
+        self.assertEqual(self.actor_name(), 'Replica')
+
+    @override_settings(DATABASE_REPLICAS={'replica': 1, 'default': 0})
+    def test_router_by_weight_and_request_writes(self):
+        router = ReplicaRouter()
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Actor), 'default')
+            state.replica_reads = True
+            self.assertEqual({router.db_for_read(Actor) for _ in range(20)}, {'replica'})
+            self.assertEqual(router.db_for_write(Actor), 'default')
+            self.assertEqual(router.db_for_read(Actor), 'default')
+        finally:
+            current_routing.reset(token)
+        self.assertEqual(router.db_for_read(Actor), 'default')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+
+    def close(self):
+        self.alive = False
+
+
+class ConnectionPoolTest(APITestCase):
+    """Connection reuse, pre-ping and stats of the in-process pool
+
+    """
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, lambda conn: conn.alive, max_size=2, timeout=0.05)
+
+    def connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def test_checked_in_connection_is_reused(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        self.assertIs(self.pool.checkout(), first)
+        stats = self.pool.snapshot()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['in_use']), (2, 1, 1))
+
+    def test_dead_connection_is_replaced_on_checkout(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        first.alive = False
+        second = self.pool.checkout()
+        self.assertIsNot(second, first)
+        stats = self.pool.snapshot()
+        self.assertEqual((stats['reconnects'], stats['size']), (1, 1))
+
+    def test_full_pool_times_out(self):
+        self.pool.checkout()
+        self.pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            self.pool.checkout()
+        self.assertEqual(self.pool.snapshot()['timeouts'], 1)
+
+    def test_pool_wait_is_in_server_timing(self):
+        metrics = RequestMetrics()
+        metrics.total_ms = 1.0
+        token = current_metrics.set(metrics)
+        try:
+            self.pool.checkout()
+        finally:
+            current_metrics.reset(token)
+        self.assertIn('pool;dur=', metrics.server_timing())
+
+    def test_admin_page_lists_pools(self):
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(staff)
+        with mock.patch.dict(pools, {'default': self.pool}):
+            response = self.client.get('/admin/db-pools/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['databases'][0]['pool']['max_size'], 2)
+
+
+def fake_psycopg2():
+    """Modules standing in for psycopg2, enough to load the PostgreSQL backends"""
+    psycopg2 = mock.MagicMock(__version__='2.9.1 (dt dec pq3 ext lo64)')
+    psycopg2.Error = type('Error', (Exception,), {})
+    psycopg2.InterfaceError = type('InterfaceError', (psycopg2.Error,), {})
+    psycopg2.DatabaseError = type('DatabaseError', (psycopg2.Error,), {})
+    for name in ('DataError', 'OperationalError', 'IntegrityError', 'InternalError',
+                 'ProgrammingError', 'NotSupportedError'):
+        setattr(psycopg2, name, type(name, (psycopg2.DatabaseError,), {}))
+    return {
+        'psycopg2': psycopg2,
+        'psycopg2.errorcodes': psycopg2.errorcodes,
+        'psycopg2.extensions': psycopg2.extensions,
+        'psycopg2.extras': psycopg2.extras,
+    }
+
+
+class PooledBackendTest(APITestCase):
+    """Pooled PostgreSQL backend over a mocked psycopg2, connections of worker threads
+
+    """
+
+    def setUp(self):
+        modules = fake_psycopg2()
+        patcher = mock.patch.dict(sys.modules, modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.psycopg2 = modules['psycopg2']
+        self.psycopg2.connect.side_effect = self.connect
+        self.opened = []
+        connections.databases['pooled'] = {
+            'ENGINE': 'movies.backends.postgresql_pool',
+            'NAME': 'movies',
+            # Persistent by Django's rules, the pool must still get it back
+            'CONN_MAX_AGE': 60,
+            'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0.05},
+        }
+        self.addCleanup(connections.databases.pop, 'pooled')
+        self.addCleanup(pools.pop, 'pooled', None)
+
+    def connect(self, **params):
+        connection = mock.MagicMock(closed=0, autocommit=True, isolation_level=None)
+        connection.get_transaction_status.return_value = self.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.opened.append(connection)
+        return connection
+
+    def in_thread(self, function):
+        errors = []
+
+        def target():
+            try:
+                function()
+            except Exception as error:
+                errors.append(error)
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def query_in_view(self):
+        def view(request):
+            connections['pooled'].ensure_connection()
+            return HttpResponse()
+        call_view(view, APIRequestFactory().get('/movie/'))
+
+    def test_executor_threads_return_connections(self):
+        self.in_thread(self.query_in_view)
+        self.in_thread(self.query_in_view)
+        stats = pools['pooled'].snapshot()
+        self.assertEqual((stats['connects'], stats['checkouts'], stats['in_use']), (1, 2, 0))
+
+    def test_open_transaction_is_rolled_back_on_checkin(self):
+        def query():
+            connections['pooled'].ensure_connection()
+            self.opened[0].get_transaction_status.return_value = self.psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+            release_connections()
+        self.in_thread(query)
+        self.opened[0].rollback.assert_called_once()
+        self.assertEqual(pools['pooled'].snapshot()['idle'], 1)
+
+
+def flaky_task(fail):
+    if fail:
+        raise ValueError('failed')
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=30)
+class JobQueueTest(APITestCase):
+    """Database job queue, its retries and the tasks moved onto it
+
+    """
+
+    def test_failed_job_is_retried_with_backoff_then_failed(self):
+        job = enqueue(flaky_task, fail=True)
+        with self.assertLogs('movies.jobs', 'WARNING'):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('ValueError', job.last_error)
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=job.run_at - timedelta(seconds=30))
+        with self.assertLogs('movies.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_max_attempts_default_follows_the_setting(self):
+        self.assertEqual(Job.objects.create(task='x', run_at=timezone.now()).max_attempts, 2)
+
+    def test_stale_running_job_is_claimed_again(self):
+        job = enqueue(flaky_task, fail=False)
+        self.assertEqual(len(claim_jobs(10)), 1)
+        self.assertEqual(claim_jobs(10), [])
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_activation_email_is_sent_by_the_worker(self):
+        response = self.client.post('/auth/users/', {
+            'username': 'viewer', 'email': 'viewer@example.com', 'password': 'Secret-pass-123',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        with self.assertRaises(CommandError):
+            call_command('run_jobs', once=True, stdout=StringIO())
+        with override_settings(DEBUG=True):
+            call_command('run_jobs', once=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['viewer@example.com'])
+        self.assertIn('activate', mail.outbox[0].body)
+
+    def test_actor_image_variants_are_queued(self):
+        with mock.patch('movies.images.missing_variants', return_value=['thumb', 'medium']):
+            actor = Actor.objects.create(name='Actor', description='Bio', image='actors/a.png')
+        self.assertEqual([job.payload for job in Job.objects.order_by('pk')], [
+            {'name': 'actors/a.png', 'version': ['actor', [actor.pk]], 'movie_ids': [], 'variants': [variant]}
+            for variant in ('thumb', 'medium')
+        ])
+
+
+def write_image(path, size=(640, 480)):
+    from PIL import Image
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, 'red').save(path)
+
+
+class ImageVariantTest(APITestCase):
+    """Resized image variants, their rendering, command and URLs in responses
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        write_image(os.path.join(self.media_root, 'movies', 'poster.png'))
+        write_image(os.path.join(self.media_root, 'actors', 'actor.png'), size=(200, 300))
+        with mock.patch('movies.images.missing_variants', return_value=[]):
+            self.actor = Actor.objects.create(name='Actor', age=40, description='Bio', image='actors/actor.png')
+            self.movie = Movie.objects.create(
+                title='Movie', description='Description', country='USA', url='movie', poster='movies/poster.png'
+            )
+        self.movie.actors.add(self.actor)
+        run_pending()
+
+    def test_render_variants_fits_every_size_and_format(self):
+        from PIL import Image
+
+        source, targets = variant_targets('movies/poster.png')
+        render_variants(source, targets)
+        for path, width, height, image_format in targets:
+            with Image.open(path) as image:
+                self.assertLessEqual(image.size[0], width)
+                self.assertLessEqual(image.size[1], height)
+                self.assertEqual(image.format, FORMATS[image_format][0])
+        with Image.open(variant_targets('movies/poster.png')[1][0][0]) as thumb:
+            self.assertEqual(thumb.size, (100, 75))
+
+    def test_command_generates_variants_and_refreshes_movies(self):
+        detail = self.client.get(f'/movie/{self.movie.pk}/').json()
+        self.assertTrue(detail['poster'].endswith('/media/movies/poster.png'))
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants of 2 images', out.getvalue())
+        self.assertFalse(missing_variants('movies/poster.png'))
+        run_pending()
+        detail = self.client.get(f'/movie/{self.movie.pk}/').json()
+        self.assertTrue(detail['poster'].endswith('/media/movies/variants/poster-medium.webp'))
+        self.assertTrue(detail['poster_jpeg'].endswith('/media/movies/variants/poster-medium.jpeg'))
+        self.assertTrue(detail['actors'][0]['image'].endswith('/media/actors/variants/actor-small.webp'))
+        self.assertTrue(detail['actors'][0]['image_jpeg'].endswith('/media/actors/variants/actor-small.jpeg'))
+        actor = self.client.get(f'/actors/{self.actor.pk}').json()
+        self.assertTrue(actor['image_jpeg'].endswith('/media/actors/variants/actor-medium.jpeg'))
+        actors = self.client.get('/actors/').json()['results']
+        self.assertTrue(actors[0]['image_jpeg'].endswith('/media/actors/variants/actor-small.jpeg'))
+
+    def test_upload_queues_one_job_per_size(self):
+        write_image(os.path.join(self.media_root, 'actors', 'new.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.actor.image = 'actors/new.png'
+            self.actor.save()
+        self.assertEqual(Job.objects.filter(task__endswith='build_variants').count(), len(VARIANTS))
+        build_variants('actors/new.png', variants=['thumb'])
+        self.assertEqual(missing_variants('actors/new.png'), ['small', 'medium'])
+        run_pending()
+        self.assertEqual(missing_variants('actors/new.png'), [])
+
+    def test_storage_is_asked_once_per_variant(self):
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            first = detail_data(self.movie)
+            second = detail_data(self.movie)
+        # WebP and JPEG of the poster and of the actor photo
+        self.assertEqual(exists.call_count, 4)
+        self.assertEqual(first, second)
+        build_variants('movies/poster.png')
+        self.assertTrue(detail_data(self.movie)['poster'].endswith('poster-medium.webp'))
+
+
+class BenchmarkHarnessTest(APITransactionTestCase):
+    """Default routes of the benchmark harness
+
+    Committed data, the async routes query from executor threads.
+    """
+
+    def setUp(self):
+        cache.clear()
+        generate_catalog(movies=3, actors=2, genres=1, categories=1, reviews=1, ratings=1, seed=1)
+
+    def test_every_movies_url_is_benchmarked(self):
+        patterns = {str(pattern.pattern) for pattern in movies_urls.urlpatterns} - {
+            str(pattern.pattern) for pattern in movies_urls.urlpatterns if 'format' in str(pattern.pattern)
+        }
+        benchmarked = {
+            resolve(urlsplit(route.path).path).route for route in default_routes()
+            if not route.path.startswith('/api/')
+        }
+        self.assertEqual(patterns - benchmarked, set())
+
+    def test_routes_succeed(self):
+        results = run_benchmark(repeat=1, warmup=0)
+        self.assertEqual([result['route'] for result in results if result['status'] >= 400], [])
+        sizes = {result['route']: result['response_bytes'] for result in results}
+        self.assertGreater(sizes['movie-export-csv'], 0)
+
+
+class AsyncCatalogViewsTest(APITransactionTestCase):
+    """Async catalog read views through the ASGI handler and the load comparison
+
+    Committed data, the views query from executor threads.
+    """
+
+    def setUp(self):
+        cache.clear()
+        generate_catalog(movies=3, actors=2, genres=1, categories=1, reviews=1, ratings=1, seed=1)
+        self.movie = Movie.objects.filter(draft=False).order_by('pk').first()
+
+    async def test_async_routes_match_sync_routes(self):
+        client = AsyncClient()
+        for sync_path, async_path in (
+            ('/movie/', '/async/movie/'),
+            (f'/movie/{self.movie.pk}/', f'/async/movie/{self.movie.pk}/'),
+            ('/actors/', '/async/actors/'),
+        ):
+            sync_response = await client.get(sync_path)
+            async_response = await client.get(async_path)
+            self.assertEqual(async_response.status_code, 200)
+            # Pagination links point at the path that was requested
+            self.assertEqual(
+                async_response.json().get('results', async_response.json()),
+                sync_response.json().get('results', sync_response.json()),
+            )
+
+    def test_load_comparison(self):
+        results = run_load(
+            {'movie-list': ('/movie/', '/async/movie/')}, requests=4, concurrency=(1, 2)
+        )
+        self.assertEqual(
+            [(result['mode'], result['concurrency'], result['statuses']) for result in results],
+            [('sync', 1, [200]), ('async', 1, [200]), ('sync', 2, [200]), ('async', 2, [200])],
+        )
+
+
+class PrebuiltSchemaTest(APITestCase):
+    """OpenAPI schema generated once per code version and served with an ETag
+
+    """
+
+    def setUp(self):
+        self.schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.schema_dir)
+        settings_override = override_settings(
+            OPENAPI_SCHEMA_DIR=Path(self.schema_dir), CODE_VERSION='test-1'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        yasg.code_version.cache_clear()
+        self.addCleanup(yasg.code_version.cache_clear)
+        yasg.documents.clear()
+
+    def test_schema_is_generated_once_and_revalidated(self):
+        with mock.patch.object(yasg, 'generate_schema', wraps=yasg.generate_schema) as generate:
+            first = self.client.get('/swagger.json')
+            second = self.client.get('/swagger.json')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('/movie/', first.json()['paths'])
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(Path(self.schema_dir, 'openapi-test-1.json').exists())
+        response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_prebuilt_file_of_the_code_version_is_served(self):
+        Path(self.schema_dir, 'openapi-test-1.json').write_bytes(b'{"swagger": "2.0", "paths": {}}')
+        with mock.patch.object(yasg, 'generate_schema') as generate:
+            response = self.client.get('/swagger/?format=openapi')
+        generate.assert_not_called()
+        self.assertEqual(response.json(), {'swagger': '2.0', 'paths': {}})
+
+    def test_ui_pages_do_not_generate_the_schema(self):
+        with mock.patch.object(yasg.schema_view.generator_class, 'get_schema') as get_schema:
+            for path in ('/swagger/', '/swagger/', '/redoc/'):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Django Movie')
+        get_schema.assert_not_called()
+
+    def test_failed_write_keeps_the_previous_file(self):
+        target = Path(self.schema_dir, 'openapi-test-1.json')
+        target.write_bytes(b'previous')
+        with mock.patch('drf_tutorial.yasg.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                yasg.write_file(target, b'next')
+        self.assertEqual(target.read_bytes(), b'previous')
+        self.assertEqual(list(Path(self.schema_dir).iterdir()), [target])
+        yasg.write_file(target, b'next')
+        self.assertEqual(target.read_bytes(), b'next')
+
+
+class SharedCacheCheckTest(APITestCase):
+    """Warning about a per-process cache outside development
+
+    """
+
+    def test_locmem_cache_warns_in_production(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in shared_cache_check(None)], ['movies.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}}
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(shared_cache_check(None), [])
+
+
+class MovieExportTest(APITestCase):
+    """Streaming NDJSON and CSV export of published movies
+
+    """
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Drama', description='Drama', url='drama')
+        self.genre = Genre.objects.create(name='Noir', description='Noir', url='noir')
+        self.actor = Actor.objects.create(name='Actor', age=40, description='Description')
+        for number in range(5):
+            movie = Movie.objects.create(
+                title=f'Movie {number}', description='Description', country='USA',
+                url=f'movie-{number}', category=self.category,
+            )
+            movie.genres.add(self.genre)
+            movie.actors.add(self.actor)
+        Movie.objects.create(
+            title='Draft', description='Description', country='USA', url='draft', draft=True
+        )
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        for url in ('/movie/export/', '/movie/export.ndjson'):
+            lines = self.content(self.client.get(url)).splitlines()
+            self.assertEqual(len(lines), 5)
+            movie = json.loads(lines[0])
+            self.assertEqual(movie['title'], 'Movie 0')
+            self.assertEqual(movie['category'], 'Drama')
+            self.assertEqual((movie['genres'], movie['actors'], movie['directors']), (['Noir'], ['Actor'], []))
+
+    def test_csv_export(self):
+        for url in ('/movie/export/?format=csv', '/movie/export.csv'):
+            response = self.client.get(url)
+            self.assertEqual(response['Content-Type'], 'text/csv')
+            rows = list(csv.reader(self.content(response).splitlines()))
+            self.assertEqual(rows[0][:2], ['id', 'title'])
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(rows[1][EXPORT_FIELDS.index('genres')], 'Noir')
+
+    def test_relations_are_fetched_per_chunk(self):
+        # One cursor over the movies, one query per relation for each chunk of two
+        with self.assertNumQueries(1 + 3 * 3):
+            movies = list(iter_movies(chunk_size=2))
+        self.assertEqual([movie['actors'] for movie in movies], [['Actor']] * 5)
+
+
+class CursorPaginationTest(APITestCase):
+    """Keyset pages of the movie list on unique ``(year, id)`` keys
+
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for number, year in enumerate((2000, 2001, 2000, 2000, 2002, 2000, 2001)):
+                Movie.objects.create(
+                    title=f'Movie {number}', description='Description', country='USA',
+                    url=f'movie-{number}', year=year,
+                )
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([movie['id'] for movie in data['results']])
+            url = data['links'][link]
+        return pages
+
+    def test_pages_follow_year_and_id_without_gaps_or_duplicates(self):
+        for ordering, reverse in (('year', False), ('-year', True)):
+            expected = [
+                movie.pk for movie in sorted(
+                    Movie.objects.all(), key=lambda movie: (movie.year, movie.pk), reverse=reverse
+                )
+            ]
+            pages = self.walk(f'/movie/?pagination=cursor&ordering={ordering}&page_size=2')
+            self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+            self.assertEqual(sum(pages, []), expected)
+
+    def test_previous_links_walk_back(self):
+        url = '/movie/?pagination=cursor&ordering=year&page_size=2'
+        forward = self.walk(url)
+        data = self.client.get(url).json()
+        while data['links']['next']:
+            data = self.client.get(data['links']['next']).json()
+        backward = self.walk(data['links']['previous'], link='previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_key_filter_replaces_offsets(self):
+        first = self.client.get('/movie/?pagination=cursor&ordering=year&page_size=2').json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first['links']['next'])
+        page_query = next(query['sql'] for query in queries if 'ORDER BY' in query['sql'])
+        self.assertIn('"year" > ', page_query)
+        self.assertNotIn('OFFSET', page_query)
+
+    def test_count_only_on_request(self):
+        self.assertNotIn('count', self.client.get('/movie/?pagination=cursor').json())
+        self.assertEqual(self.client.get('/movie/?pagination=cursor&count=1').json()['count'], 7)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/movie/?pagination=cursor&cursor=bad').status_code, 404)
+
+
+class RatingAggregatesTest(APITestCase):
+    """Stored rating count, sum and middle star kept by votes, admin edits and the rebuild
+
+    """
+
+    def setUp(self):
+        self.movie = Movie.objects.create(
+            title='Movie', description='Description', country='USA', url='movie'
+        )
+        self.four = RatingStar.objects.create(value=4)
+        self.two = RatingStar.objects.create(value=2)
+
+    def aggregates(self):
+        self.movie.refresh_from_db()
+        return self.movie.rating_count, self.movie.rating_sum, self.movie.middle_star
+
+    def vote(self, star, ip='127.0.0.1'):
+        serializer = CreateRatingSerializer(data={'star': star.pk, 'movie': self.movie.pk})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save(ip=ip)
+
+    def test_create_change_and_unchanged_votes(self):
+        self.vote(self.four)
+        self.assertEqual(self.aggregates(), (1, 4, 4.0))
+        self.vote(self.two, ip='10.0.0.1')
+        self.assertEqual(self.aggregates(), (2, 6, 3.0))
+        self.vote(self.four, ip='10.0.0.1')
+        self.assertEqual(self.aggregates(), (2, 8, 4.0))
+        with CaptureQueriesContext(connection) as queries:
+            self.vote(self.four, ip='10.0.0.1')
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.assertEqual(self.aggregates(), (2, 8, 4.0))
+
+    def test_concurrent_first_vote_becomes_a_change(self):
+        Rating.objects.create(ip='127.0.0.1', movie=self.movie, star=self.four)
+        rebuild_rating_aggregates()
+        real = CreateRatingSerializer.locked_rating
+        lookups = iter([None])
+        with mock.patch.object(
+            CreateRatingSerializer, 'locked_rating',
+            lambda serializer, ip, movie: next(lookups, None) or real(serializer, ip, movie),
+        ):
+            rating = self.vote(self.two)
+        self.assertEqual(rating.star, self.two)
+        self.assertEqual(self.aggregates(), (1, 2, 2.0))
+
+    def test_admin_changes_and_deletes_keep_aggregates(self):
+        rating = self.vote(self.four)
+        self.vote(self.two, ip='10.0.0.1')
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(staff)
+        response = self.client.post(f'/admin/movies/rating/{rating.pk}/change/', {
+            'ip': rating.ip, 'star': self.two.pk, 'movie': self.movie.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.aggregates(), (2, 4, 2.0))
+        rating.delete()
+        self.assertEqual(self.aggregates(), (1, 2, 2.0))
+        self.two.value = 3
+        self.two.save()
+        self.assertEqual(self.aggregates(), (1, 3, 3.0))
+
+    def test_rebuild_command(self):
+        Rating.objects.bulk_create([
+            Rating(ip='127.0.0.1', movie=self.movie, star=self.four),
+            Rating(ip='10.0.0.1', movie=self.movie, star=self.two),
+        ])
+        self.assertEqual(self.aggregates(), (0, 0, None))
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.assertEqual(self.aggregates(), (2, 6, 3.0))
+
+
+class BulkRatingTest(APITestCase):
+    """Bulk votes of one ip written with INSERT ... ON CONFLICT
+
+    """
+
+    def setUp(self):
+        self.movies = [
+            Movie.objects.create(
+                title=f'Movie {number}', description='Description', country='USA',
+                url=f'movie-{number}',
+            )
+            for number in range(3)
+        ]
+        self.four = RatingStar.objects.create(value=4)
+        self.two = RatingStar.objects.create(value=2)
+
+    def post(self, ratings):
+        return self.client.post('/rating/bulk/', {'ratings': ratings}, format='json')
+
+    def test_created_and_updated_votes_with_aggregates(self):
+        first, second, third = self.movies
+        Rating.objects.create(ip='127.0.0.1', movie=first, star=self.two)
+        Rating.objects.create(ip='10.0.0.1', movie=first, star=self.four)
+        rebuild_rating_aggregates()
+        response = self.post([
+            {'movie': first.pk, 'star': self.four.pk},
+            {'movie': second.pk, 'star': self.two.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['movie'], item['status']) for item in response.json()['results']],
+            [(first.pk, 'updated'), (second.pk, 'created')],
+        )
+        self.assertEqual(Rating.objects.get(ip='127.0.0.1', movie=first).star, self.four)
+        for movie, aggregates in ((first, (2, 8, 4.0)), (second, (1, 2, 2.0)), (third, (0, 0, None))):
+            movie.refresh_from_db()
+            self.assertEqual((movie.rating_count, movie.rating_sum, movie.middle_star), aggregates)
+
+    def test_unknown_movies_and_stars_are_reported_per_item(self):
+        response = self.post([
+            {'movie': self.movies[0].pk, 'star': self.four.pk},
+            {'movie': 999, 'star': self.four.pk},
+            {'movie': self.movies[1].pk, 'star': 999},
+        ])
+        results = response.json()['results']
+        self.assertEqual([item['status'] for item in results], ['created', 'error', 'error'])
+        self.assertIn('movie', results[1]['errors'])
+        self.assertIn('star', results[2]['errors'])
+        self.assertEqual(Rating.objects.count(), 1)
+
+    def test_repeated_movie_is_rejected(self):
+        movie = self.movies[0].pk
+        response = self.post([
+            {'movie': movie, 'star': self.four.pk},
+            {'movie': movie, 'star': self.two.pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(movie), str(response.json()['ratings']))
+        self.assertFalse(Rating.objects.exists())
+
+
+class RequestMetricsTest(APITestCase):
+    """Server-Timing header and the per-route metrics snapshot
+
+    """
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        Movie.objects.create(title='Movie', description='Description', country='USA', url='movie')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/movie/')
+        timings = dict(
+            part.split(';', 1) for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timings), {'db', 'serializer', 'render', 'total'})
+        self.assertRegex(timings['db'], r'dur=[\d.]+;desc="\d+ queries"')
+
+    def test_metrics_are_aggregated_per_route(self):
+        self.client.get('/movie/')
+        self.client.get('/movie/')
+        self.client.get('/no/such/path/1')
+        self.client.get('/no/such/path/2')
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(staff)
+        snapshot = self.client.get('/metrics/').json()
+        self.assertEqual(set(snapshot), {'routes', 'db_pools'})
+        routes = snapshot['routes']
+        self.assertEqual(routes['GET /movie/']['requests'], 2)
+        self.assertGreater(routes['GET /movie/']['mean_queries'], 0)
+        self.assertEqual(routes['GET <unmatched>']['requests'], 2)
+        self.assertFalse([route for route in routes if 'no/such' in route])
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
@@ -0,0 +1,93 @@
+import time
+
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .service import get_client_ip
+
+THROTTLE_KEY = 'movies:throttle:{}:{}'
+# Bucket updates of a client are serialized with a cache.add lock, held
+# for at most LOCK_TIMEOUT seconds, waited for LOCK_ATTEMPTS times
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 50
+LOCK_DELAY = 0.005
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket per client ip and per authenticated user for writes
+
+    The view's ``throttle_scope`` picks a rate from ``DEFAULT_THROTTLE_RATES``:
+    ``'30/min'`` is a bucket of 30 tokens refilled at 30 per minute. A write
+    takes a token from every bucket of the client and is rejected when one
+    of them is empty. Buckets live in the cache, only the user lookup of
+    token authentication touches the database. Scopes without a rate are
+    not throttled.
+
+    Reading and writing a bucket is not atomic in the cache API, so the
+    update runs under a lock taken with ``cache.add``, atomic on shared
+    backends. A write that can't get the lock is throttled.
+    """
+    periods = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def parse_rate(self, rate):
+        """``'30/min'`` -> ``(30, 0.5)``, capacity and tokens per second"""
+        count, period = rate.split('/')
+        capacity = int(count)
+        return capacity, capacity / self.periods[period[0]]
+
+    def get_idents(self, request):
+        idents = [f'ip-{get_client_ip(request)}']
+        if request.user and request.user.is_authenticated:
+            idents.append(f'user-{request.user.pk}')
+        return idents
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if request.method in SAFE_METHODS or rate is None:
+            return True
+        capacity, refill = self.parse_rate(rate)
+        keys = sorted(THROTTLE_KEY.format(scope, ident) for ident in self.get_idents(request))
+        locks = []
+        try:
+            for key in keys:
+                if not self.lock(f'{key}:lock'):
+                    self.wait_seconds = LOCK_TIMEOUT
+                    return False
+                locks.append(f'{key}:lock')
+            return self.take_token(keys, capacity, refill)
+        finally:
+            cache.delete_many(locks)
+
+    def lock(self, key):
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(key, True, LOCK_TIMEOUT):
+                return True
+            time.sleep(LOCK_DELAY)
+        return False
+
+    def take_token(self, keys, capacity, refill):
+        """Take a token from every bucket of ``keys`` if none of them is empty"""
+        now = time.time()
+        stored = cache.get_many(keys)
+        buckets = {}
+        for key in keys:
+            tokens, updated = stored.get(key, (capacity, now))
+            buckets[key] = min(capacity, tokens + (now - updated) * refill)
+        lowest = min(buckets.values())
+        if lowest < 1:
+            self.wait_seconds = (1 - lowest) / refill
+            return False
+        cache.set_many(
+            {key: (tokens - 1, now) for key, tokens in buckets.items()},
+            timeout=int(capacity / refill) + 1,
+        )
+        return True
+
+    def wait(self):
+        return self.wait_seconds
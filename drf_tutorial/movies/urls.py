@@ -1,13 +1,22 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
 
-from . import views
+from . import async_views, views
 
 urlpatterns = format_suffix_patterns({
     path('movie/', views.MovieViewSet.as_view({'get': 'list'})),
     path('movie/<int:pk>/', views.MovieViewSet.as_view({'get': 'retrieve'})),
+    path('movie/export/', views.MovieExportView.as_view()),
+    path('movie/search/', views.MovieViewSet.as_view({'get': 'search'})),
     path('review/', views.ReviewCreateView.as_view({'post': 'create'})),
     path('rating/', views.AddStarRatingView.as_view({'post': 'create'})),
+    path('rating/bulk/', views.AddStarRatingBulkView.as_view({'post': 'create'})),
+    path('rating/mine/', views.MyRatingsView.as_view()),
     path('actors/', views.ActorsViewSet.as_view({'get': 'list'})),
     path('actors/<int:pk>', views.ActorsViewSet.as_view({'get': 'retrieve'})),
+    path('metrics/', views.RequestMetricsView.as_view()),
+    path('async/movie/', async_views.movie_list),
+    path('async/movie/<int:pk>/', async_views.movie_detail),
+    path('async/actors/', async_views.actor_list),
+    path('async/actors/<int:pk>', async_views.actor_detail),
 })
@@ -1,64 +1,314 @@
-from django.db.models import Count, Q, Sum, F
+from django.db import router
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet, ModelViewSet
 
-from .models import Movie, Actor
+from .cache import get_movie_detail, get_movie_facets, set_movie_detail, set_movie_facets
+from .cards import card_movies, detail_data, with_absolute_media
+from .conditional import ConditionalGetMixin, conditional_get
+from .dbpool import pool_stats
+from .export import csv_lines, iter_movies, ndjson_lines
+from .instrumentation import InstrumentedViewMixin, registry
+from .models import Movie, MovieCard, Actor, Rating
+from .renderers import ORJSONRendererMixin
+from .routers import ReplicaReadMixin, primary_reads
+from .search import SEARCH_LIMIT, search_movies
 from .serializers import (
     MovieListSerializer, MovieDetailSerializer,
-    ReviewCreateSerializer, CreateRatingSerializer,
-    ActorListSerializer, ActorDetailSerializer
+    ReviewCreateSerializer, CreateRatingSerializer, BulkRatingSerializer, MovieIdsSerializer,
+    ActorListSerializer, ActorFilmographySerializer
 )
-from .service import get_client_ip, MovieFilter, PaginationMovie
+from .service import (
+    get_client_ip, get_ratings, MovieFilter, PaginationActor, PaginationMovie, CursorPaginationMovie,
+    with_filmography, with_filmography_counts
+)
+from .sparse import SparseFieldsViewMixin, query_list
+from .throttling import TokenBucketThrottle
+
 
+class MovieViewSet(
+    InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, SparseFieldsViewMixin,
+    ORJSONRendererMixin, ReadOnlyModelViewSet
+):
+    """Movie list api view
 
-class MovieViewSet(ReadOnlyModelViewSet):
-    """Movie list api view"""
+    ``?fields=`` picks the returned fields and ``?expand=`` the embedded
+    relations of the detail, the rest of them are returned as ids.
+    ``?shared=1`` leaves out the per-client ``rating_user``, so responses
+    are the same for everybody and publicly cacheable.
+    """
     filter_backends = (DjangoFilterBackend,)
     filter_class = MovieFilter
     pagination_class = PaginationMovie
+    cursor_pagination_class = CursorPaginationMovie
+    version_name = 'movie'
+
+    @property
+    def paginator(self):
+        """Keyset pagination when requested with ``?pagination=cursor``"""
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-        movies = Movie.objects.filter(draft=False).annotate(
-            rating_user=Count(
-                'ratings', filter=Q(ratings__ip=get_client_ip(self.request))
-            ),
-        ).annotate(
-            middle_star=Sum(F('ratings__star')) / Count(F('ratings'))
-        )
+        movies = Movie.objects.filter(draft=False)
+        sparse = self.action in ('retrieve', 'search') and self.is_sparse()
+        if sparse:
+            movies = self.sparse_queryset(movies)
+        if self.wants_field('rating_user') and (
+            not sparse or 'rating_user' in self.get_serializer().fields
+        ):
+            movies = movies.annotate(
+                rating_user=Count(
+                    'ratings', filter=Q(ratings__ip=get_client_ip(self.request))
+                ),
+            )
         return movies
 
+    def is_shared_response(self):
+        return self.request.query_params.get('shared') in ('1', 'true')
+
+    def wants_field(self, name):
+        if name == 'rating_user' and self.is_shared_response():
+            return False
+        fields = self.get_sparse_params().get('fields')
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_shared_response():
+            kwargs.setdefault('omit', ('rating_user',))
+        return super().get_serializer(*args, **kwargs)
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        """Movies are filtered and paginated by id, payloads come from movie cards"""
+        movies = self.filter_queryset(Movie.objects.filter(draft=False).only('id', 'year').order_by('pk'))
+        page = self.paginate_queryset(movies)
+        data = self.get_list_data([movie.pk for movie in (movies if page is None else page)])
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = self.get_facets()
+        return response
+
+    def get_list_data(self, ids):
+        cards = dict(MovieCard.objects.filter(pk__in=ids).values_list('pk', 'list_data'))
+        missing = [pk for pk in ids if pk not in cards]
+        if missing:
+            rows = MovieListSerializer(
+                self.get_queryset().filter(pk__in=missing), many=True,
+                omit=() if self.wants_field('rating_user') else ('rating_user',),
+            ).data
+            cards.update((row['id'], row) for row in rows)
+        fields = self.get_sparse_params().get('fields')
+        if fields is not None:
+            cards = {
+                pk: {name: value for name, value in card.items() if name in fields}
+                for pk, card in cards.items()
+            }
+        if not self.wants_field('rating_user'):
+            return [
+                {name: value for name, value in cards[pk].items() if name != 'rating_user'}
+                for pk in ids if pk in cards
+            ]
+        rated = set(Rating.objects.filter(
+            movie_id__in=ids, ip=get_client_ip(self.request)
+        ).values_list('movie_id', flat=True))
+        return [{**cards[pk], 'rating_user': pk in rated} for pk in ids if pk in cards]
+
+    def get_facets(self):
+        """Genre and year counts for the current filters, cached per combination"""
+        filterset = self.filter_class(
+            self.request.query_params, queryset=Movie.objects.filter(draft=False),
+            request=self.request,
+        )
+        if not filterset.is_valid():
+            return {}
+        filters = filterset.cache_key()
+        facets = get_movie_facets(filters)
+        if facets is None:
+            # Cached under the current catalog version, a lagging replica
+            # would keep stale counts there until the entry expires
+            with primary_reads():
+                facets = filterset.facets()
+            set_movie_facets(filters, facets)
+        return facets
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        """Shared detail payload comes from the cache or the movie card,
+        rating_user is per client. Sparse requests are serialized from
+        a queryset trimmed to the requested fields.
+        """
+        pk = kwargs[self.lookup_field]
+        if self.is_sparse():
+            data = self.get_serializer(self.get_object()).data
+        else:
+            data = get_movie_detail(pk)
+            if data is None:
+                # The cached payload is shared by every client, a replica
+                # behind the invalidation would cache stale data
+                with primary_reads():
+                    data = MovieCard.objects.filter(pk=pk).values_list('detail_data', flat=True).first()
+                    if data is None:
+                        data = detail_data(get_object_or_404(card_movies(), pk=pk))
+                set_movie_detail(pk, data)
+            data = with_absolute_media(data, request)
+        if self.wants_field('rating_user'):
+            data['rating_user'] = Rating.objects.filter(
+                movie_id=pk, ip=get_client_ip(request)
+            ).exists()
+        return Response(data)
+
+    def search(self, request, *args, **kwargs):
+        """Ranked full-text search over title, tagline, description and actors"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), SEARCH_LIMIT))
+        except ValueError:
+            limit = 20
+        movies = search_movies(
+            self.get_queryset(), request.query_params.get('q', ''), limit=limit
+        )
+        serializer = self.get_serializer(movies, many=True)
+        return Response({'results': serializer.data})
+
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ('list', 'search'):
             return MovieListSerializer
         elif self.action == 'retrieve':
             return MovieDetailSerializer
 
 
-class ReviewCreateView(ModelViewSet):
+class MovieExportView(ReplicaReadMixin, View):
+    """Streaming export of published movies as NDJSON or CSV (``?format=csv`` or ``export.csv``)
+
+    """
+    formats = {
+        'ndjson': (ndjson_lines, 'application/x-ndjson', 'movies.ndjson'),
+        'csv': (csv_lines, 'text/csv', 'movies.csv'),
+    }
+
+    def get(self, request, format=None):
+        lines, content_type, filename = self.formats.get(
+            format or request.GET.get('format'), self.formats['ndjson']
+        )
+        # Rows are streamed after the view returns, the database is chosen now
+        movies = iter_movies(using=router.db_for_read(Movie))
+        response = StreamingHttpResponse(lines(movies), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ReviewCreateView(InstrumentedViewMixin, ModelViewSet):
     """Review create view
 
     """
     serializer_class = ReviewCreateSerializer
+    throttle_classes = (TokenBucketThrottle,)
+    throttle_scope = 'review'
 
 
-class AddStarRatingView(ModelViewSet):
+class AddStarRatingView(InstrumentedViewMixin, ModelViewSet):
     """Adding rating for movie
 
     """
     serializer_class = CreateRatingSerializer
+    throttle_classes = (TokenBucketThrottle,)
+    throttle_scope = 'rating'
 
     def perform_create(self, serializer):
         serializer.save(ip=get_client_ip(self.request))
 
 
-class ActorsViewSet(ReadOnlyModelViewSet):
+class AddStarRatingBulkView(InstrumentedViewMixin, GenericViewSet):
+    """Adding many ratings of one user with a single bulk upsert
+
+    """
+    serializer_class = BulkRatingSerializer
+    throttle_classes = (TokenBucketThrottle,)
+    throttle_scope = 'rating-bulk'
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(ip=get_client_ip(request))
+        return Response({'results': results})
+
+
+class MyRatingsView(InstrumentedViewMixin, APIView):
+    """Stars the caller gave to the movies of ``?movies=1,2,3``
+
+    """
+
+    def get(self, request, format=None):
+        serializer = MovieIdsSerializer(data={'movies': query_list(request, 'movies') or []})
+        serializer.is_valid(raise_exception=True)
+        return Response({
+            'ratings': get_ratings(get_client_ip(request), serializer.validated_data['movies']),
+        })
+
+
+class ActorsViewSet(
+    InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, SparseFieldsViewMixin,
+    ORJSONRendererMixin, ReadOnlyModelViewSet
+):
     """Actors list view
 
+    Pages carry published movie counts, the detail also the compact
+    filmography as actor and as director.
     """
-    queryset = Actor.objects.all()
+    queryset = Actor.objects.order_by('pk')
+    pagination_class = PaginationActor
+    version_name = 'actor'
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        """Actors are paginated as ``values()`` rows for the serializer fast path"""
+        rows = self.get_serializer(many=True).values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        serializer = self.get_serializer(rows if page is None else page, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """Counts and filmographies are only queried when the response shows them"""
+        actors = super().get_queryset()
+        fields = self.get_serializer().fields
+        if self.is_sparse():
+            actors = self.sparse_queryset(actors)
+        if self.action == 'retrieve':
+            return with_filmography(actors, fields)
+        return with_filmography_counts(actors, fields)
 
     def get_serializer_class(self):
         if self.action == 'list':
             return ActorListSerializer
         elif self.action == 'retrieve':
-            return ActorDetailSerializer
+            return ActorFilmographySerializer
+
+
+class RequestMetricsView(APIView):
+    """Per-route request metrics and connection pool stats of this process, staff only
+
+    ``{"routes": {"GET /movie/": {...}}, "db_pools": {"default": {...}}}``
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response({'routes': registry.snapshot(), 'db_pools': pool_stats()})